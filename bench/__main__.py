@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# Offline parser benchmarks over the saved pages in bench/fixtures.
+#
+#   python -m bench                     run, compare against bench/baseline.json
+#   python -m bench --update-baseline   run and store the results as the new baseline
+#
+# Exits non-zero when a parser's output no longer matches bench/expected.json, when
+# its throughput/peak memory regresses past the baseline by more than --tolerance, or
+# when a rewritten helper disagrees with its original (bench/reference.py) on data/.
+# Timings are machine-specific, so refresh the baseline on the machine that runs this.
+import argparse
+import functools
+import gc
+import glob
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import List
+
+from bench import corpus, reference
+from src import thehill
+from src.clusters import ClusterBuilder
+from src.mealswipes import parse_meal_plan
+from src.models import MunchDish, MunchIngredientList, MunchLocation, MunchNutrition
+from src.normalize import sanitize_name
+from src.output import JsonArrayWriter
+from src.parsing import make_soup
+from src.schedule import RefreshScheduler
+from src.store import DishStore
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "baseline.json")
+EXPECTED_FILE = os.path.join(os.path.dirname(__file__), "expected.json")
+MEALS_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "meals")
+THEHILL_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "thehill.json")
+
+# Shared by the benchmarks that don't need a cold store, set up by main()
+CONTEXT: "thehill.ScrapeContext"
+
+
+def scrape_context() -> thehill.ScrapeContext:
+    # Dish details go to an in-memory store instead of data/meals.db
+    ctx = thehill.ScrapeContext(DishStore(":memory:"))
+    ctx.scheduler = RefreshScheduler(ctx.store)
+    return ctx
+
+
+def bench_parse_dish_nutrition():
+    results = []
+    for name in corpus.RECIPE_PAGES + corpus.COMPLEX_PAGES:
+        soup = make_soup(corpus.load(name), "dish")
+        results.append(thehill.parse_dish_nutrition(soup.select_one("div#nutrition")).model_dump())
+    return len(results), len(results), results
+
+
+def bench_parse_dish_ingredients():
+    results = []
+    for name in corpus.RECIPE_PAGES:
+        soup = make_soup(corpus.load(name), "dish")
+        results.append([i.model_dump() for i in thehill.parse_dish_ingredients(soup.select_one("div#ingredient_list"))])
+    return len(results), len(results), results
+
+
+def bench_parse_location_dishes():
+    # Cold dish store, so every card goes through its (fixture) detail page
+    ctx = scrape_context()
+    results = []
+    soup = make_soup(corpus.load(corpus.DATE_PAGES[0]), "date")
+    for menu in soup.select("div.recipe-list"):
+        results.append(thehill.parse_location_dishes(ctx, menu))
+    dishes = sum(len(ids) for ids in results)
+    # One written dish per detail page layout is enough to pin the output down
+    layouts = len(corpus.RECIPE_PAGES + corpus.COMPLEX_PAGES)
+    for dish_id in sorted({dish_id % layouts: dish_id for ids in results for dish_id in ids}.values()):
+        results.append(json.loads(ctx.store.get(dish_id)))
+    return 1, dishes, results
+
+
+def bench_parse_location_meal_periods():
+    hours = thehill.parse_location_hours(
+        make_soup(corpus.load(corpus.LOCATION_PAGES[0]), "location").select_one(".dining-hours-summary"))
+    results = []
+    dishes = 0
+    for name in corpus.DATE_PAGES:
+        raw_html = corpus.load(name)
+        if name == "date-bruin-bowl.html":
+            raw_html = raw_html.replace('breakfastmenu', 'dinnermenu')
+        periods = thehill.parse_location_meal_periods(CONTEXT, make_soup(raw_html, "date"), hours)
+        dishes += sum(len(station.dishes) for period in periods for station in period.stations)
+        results.append([period.model_dump() for period in periods])
+    return len(results), dishes, results
+
+
+def bench_parse_location_hours():
+    soup = make_soup(corpus.load(corpus.LOCATION_PAGES[0]), "location")
+    hours = thehill.parse_location_hours(soup.select_one(".dining-hours-summary"))
+    return 1, 0, [hours.model_dump()]
+
+
+def bench_parse_location_dates():
+    soup = make_soup(corpus.load(corpus.LOCATION_PAGES[0]), "location")
+    dates = thehill.parse_location_dates(soup.select_one("select"))
+    return 1, 0, [[date.model_dump() for date in dates]]
+
+
+def bench_parse_meal_plan():
+    results = []
+    for name in corpus.MEALPLAN_PAGES:
+        quarter, plan = parse_meal_plan(make_soup(corpus.load(name), "article"), "19P")
+        results.append([quarter, plan.model_dump()])
+    return len(results), 0, results
+
+
+@functools.cache
+def committed_locations() -> tuple[str, List[MunchLocation]]:
+    with open(THEHILL_FILE, "r") as f:
+        raw = f.read()
+    return raw, [MunchLocation.model_validate(location) for location in json.loads(raw)]
+
+
+def bench_write_thehill():
+    # Writes the committed data/thehill.json back out the way thehill.main() does. That
+    # file came from the old json.dumps(json.loads(model_dump_json())) round trip, so the
+    # bytes must match it exactly.
+    raw, locations = committed_locations()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "thehill.json")
+        with JsonArrayWriter(path) as out:
+            out.write_all(locations)
+        with open(path, "r") as f:
+            written = f.read()
+    dishes = sum(len(station.dishes) for location in locations for date in location.dates
+                 for period in date.periods for station in period.stations)
+    return len(locations), dishes, [written == raw]
+
+
+@functools.cache
+def raw_dishes() -> List[dict]:
+    # Stored dishes in data/meals as the plain values a parser hands to validation
+    dishes = []
+    for path in sorted(glob.glob(os.path.join(MEALS_DIR, "*.json")))[:500]:
+        if os.path.basename(path).startswith("_"):
+            continue
+        with open(path, "r") as f:
+            dish = json.load(f)
+        dish["nutrition"] = {key: value for key, value in dish["nutrition"].items() if value is not None}
+        dishes.append(dish)
+    return dishes
+
+
+def bench_validate_dish():
+    # Validate-once: one batch for the ingredient list, one model for the nutrition
+    # dict, and the dish around them takes both as-is
+    results = []
+    for d in raw_dishes():
+        ingredients = MunchIngredientList.validate_python(d["ingredients"])
+        nutrition = MunchNutrition.model_validate(d["nutrition"])
+        dish = MunchDish(name=d["name"], id=d["id"], labels=d["labels"], ingredients=ingredients, nutrition=nutrition)
+        results.append(dish)
+    # Each stored dish counts as one page here
+    return len(results), len(results), [dish.model_dump() for dish in results[:3]]
+
+
+def bench_validate_dish_per_object():
+    # The same dishes validated the way thehill used to, for comparison
+    results = []
+    for d in raw_dishes():
+        dish = reference.validate_dish(d["name"], d["id"], d["labels"], d["ingredients"], d["nutrition"])
+        results.append(dish)
+    # Each stored dish counts as one page here
+    return len(results), len(results), [dish.model_dump() for dish in results[:3]]
+
+
+BENCHMARKS = {
+    "parse_dish_nutrition": bench_parse_dish_nutrition,
+    "parse_dish_ingredients": bench_parse_dish_ingredients,
+    "parse_location_dishes": bench_parse_location_dishes,
+    "parse_location_meal_periods": bench_parse_location_meal_periods,
+    "parse_location_hours": bench_parse_location_hours,
+    "parse_location_dates": bench_parse_location_dates,
+    "parse_meal_plan": bench_parse_meal_plan,
+    "write_thehill": bench_write_thehill,
+    "validate_dish": bench_validate_dish,
+    "validate_dish_per_object": bench_validate_dish_per_object,
+}
+
+
+def all_dish_names() -> List[str]:
+    names = set()
+    for path in glob.glob(os.path.join(MEALS_DIR, "*.json")):
+        if os.path.basename(path).startswith("_"):
+            continue
+        with open(path, "r") as f:
+            dish = json.load(f)
+        names.add(dish["name"])
+        names.update(ingredient["name"] for ingredient in dish["ingredients"])
+    return sorted(names)
+
+
+def check_differential() -> List[str]:
+    failures = []
+    names = all_dish_names()
+    mismatches = [name for name in names if sanitize_name(name) != reference.sanitize_name(name)]
+    print(f"{'sanitize_name':<30} {len(names):>10} names {len(mismatches):>6} mismatches")
+    for name in mismatches[:10]:
+        failures.append(f"sanitize_name({name!r}): {sanitize_name(name)!r} != {reference.sanitize_name(name)!r}")
+    return failures
+
+
+def check_clusters() -> List[str]:
+    # One ClusterBuilder over several runs (the daemon's case) has to pick up a changed dish
+    with tempfile.TemporaryDirectory() as tmp:
+        store = DishStore(":memory:")
+        builder = ClusterBuilder(store, tmp, os.path.join(tmp, "_cache.json"))
+        for run_number, name in enumerate(["old", "new"]):
+            store.put(1, json.dumps({"id": 1, "name": name}), run_number)
+            builder.set_members(865, {1})
+            written = builder.build({1})
+            with open(os.path.join(tmp, "865.json"), "r") as f:
+                dishes = json.load(f)
+            if written != [865] or dishes[0]["name"] != name:
+                return [f"ClusterBuilder: run {run_number + 1} wrote {written}, cluster has {dishes[0]['name']!r} "
+                        f"instead of {name!r}"]
+        store.close()
+    print(f"{'ClusterBuilder':<30} {'changed dish picked up on a later run':>30}")
+    return []
+
+
+def run(fn, repeats: int, min_time: float) -> dict:
+    fn()  # warm-up (imports, regex compiles, first dish stores)
+    # Best of several timed repeats, each at least min_time long, to ride out noise
+    pages_per_s = dishes_per_s = 0.0
+    for _ in range(repeats):
+        pages = dishes = 0
+        start = time.perf_counter()
+        while (elapsed := time.perf_counter() - start) < min_time:
+            p, d, results = fn()
+            pages += p
+            dishes += d
+        pages_per_s = max(pages_per_s, pages / elapsed)
+        dishes_per_s = max(dishes_per_s, dishes / elapsed)
+    peaks = []
+    for _ in range(3):
+        # Cyclic garbage left by earlier iterations (soup trees) would otherwise count
+        gc.collect()
+        tracemalloc.start()
+        fn()
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return {
+        "pages_per_s": round(pages_per_s, 1),
+        "dishes_per_s": round(dishes_per_s, 1),
+        "peak_kib": round(min(peaks) / 1024),
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m bench")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per timed repeat")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="allowed regression vs baseline (0.3 = 30%%)")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("only", nargs="*", help="benchmark names to run (default: all)")
+    args = parser.parse_args()
+
+    global CONTEXT
+    logging.disable(logging.INFO)
+    CONTEXT = scrape_context()
+    thehill.get_page = lambda ctx, url: corpus.recipe_for(url)
+
+    baseline = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, "r") as f:
+            baseline = json.load(f)
+    expected = {}
+    if os.path.exists(EXPECTED_FILE):
+        with open(EXPECTED_FILE, "r") as f:
+            expected = json.load(f)
+
+    failures = []
+    measured = {}
+    print(f"{'benchmark':<30} {'pages/s':>10} {'dishes/s':>10} {'peak KiB':>9}   vs baseline")
+    for name, fn in BENCHMARKS.items():
+        if args.only and name not in args.only:
+            continue
+        result = run(fn, args.repeats, args.min_time)
+        results = json.loads(json.dumps(result.pop("results")))
+        measured[name] = result
+
+        notes = []
+        base = baseline.get(name)
+        if base:
+            speed = result["pages_per_s"] / base["pages_per_s"]
+            notes.append(f"{speed:.2f}x speed")
+            if speed < 1 - args.tolerance:
+                failures.append(f"{name}: throughput {result['pages_per_s']} pages/s < baseline {base['pages_per_s']}")
+            if result["peak_kib"] > base["peak_kib"] * (1 + args.tolerance):
+                failures.append(f"{name}: peak memory {result['peak_kib']} KiB > baseline {base['peak_kib']}")
+        if args.update_baseline:
+            expected[name] = results
+        elif name in expected and expected[name] != results:
+            failures.append(f"{name}: output differs from bench/expected.json")
+            notes.append("OUTPUT CHANGED")
+        print(f"{name:<30} {result['pages_per_s']:>10} {result['dishes_per_s']:>10} {result['peak_kib']:>9}   {', '.join(notes)}")
+
+    print()
+    failures += check_differential()
+    failures += check_clusters()
+
+    if args.update_baseline:
+        baseline.update(measured)
+        with open(BASELINE_FILE, "w") as f:
+            f.write(json.dumps(baseline, indent=2) + "\n")
+        with open(EXPECTED_FILE, "w") as f:
+            f.write(json.dumps(expected, indent=1) + "\n")
+        print(f"Baseline written to {BASELINE_FILE}")
+        return
+
+    for failure in failures:
+        print(f"REGRESSION {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+import functools
+import os
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+# Saved pages, by what the scraper uses them for
+LOCATION_PAGES = ["location-bruin-plate.html"]
+DATE_PAGES = ["date-bruin-plate.html", "date-cafe-1919.html", "date-bruin-bowl.html"]
+RECIPE_PAGES = ["recipe-list.html", "recipe-paragraph.html"]
+COMPLEX_PAGES = ["recipe-complex.html"]
+MEALPLAN_PAGES = ["mealplan-19p.html"]
+
+
+@functools.cache
+def load(name: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, name), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def recipe_for(url: str) -> str:
+    # Detail pages linked from the date fixtures are served from the recipe fixtures,
+    # spread by id so every layout (list, paragraph, complex grid) gets exercised
+    dish_id = int(url.split("=")[-1] or 0)
+    pages = RECIPE_PAGES + COMPLEX_PAGES
+    return load(pages[dish_id % len(pages)])
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# End-to-end scraper run against the mock site (bench/mocksite.py), for throughput at
+# several times today's dish count without touching dining.ucla.edu.
+#
+#   python -m bench.loadtest --scale 10
+#   python -m bench.loadtest --scale 100 --latency 0.05 --throttle-rate 0.01 --keep
+#
+# The scraper runs as `python -m src.thehill` in a throwaway copy of src/ with an empty
+# data/ (cold run), so the repo's data/ is never written. MUNCH_* settings are passed
+# through; MUNCH_RATE/MUNCH_BURST/MUNCH_CONCURRENCY default to loopback-friendly values.
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.mocksite import add_site_arguments, serve, site_from_args
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+LOADTEST_ENV = {
+    "MUNCH_RATE": "1000",
+    "MUNCH_BURST": "50",
+    "MUNCH_CONCURRENCY": "8",
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m bench.loadtest")
+    add_site_arguments(parser)
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory and print its path")
+    args = parser.parse_args()
+
+    site = site_from_args(args)
+    server = serve(site)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    workdir = tempfile.mkdtemp(prefix="munch-loadtest-")
+    shutil.copytree(os.path.join(ROOT, "src"), os.path.join(workdir, "src"),
+                    ignore=shutil.ignore_patterns("__pycache__"))
+    os.makedirs(os.path.join(workdir, "data"))
+    shutil.copy(os.path.join(ROOT, "data", "exceptions.json"), os.path.join(workdir, "data"))
+
+    env = {**LOADTEST_ENV, **os.environ, "MUNCH_BASE_URL": base_url}
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-m", "src.thehill"], cwd=workdir, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+    if result.returncode != 0:
+        print(result.stderr[-4000:], file=sys.stderr)
+        sys.exit(result.returncode)
+
+    with open(os.path.join(workdir, "data", "metrics.json"), "r") as f:
+        metrics = json.load(f)
+    counters = metrics["counters"]
+    dishes = counters.get("dishes.fetched", 0)
+    urls = counters.get("fetch.urls", 0)
+    print(f"scale {args.scale}: {site.requests} requests served {dict(sorted(site.statuses.items()))}")
+    print(f"{urls} URLs, {dishes} dishes fetched in {elapsed:.1f}s "
+          f"({site.requests / elapsed:.1f} requests/s, {dishes / elapsed:.1f} dishes/s)")
+    print(f"retries {counters.get('fetch.retries', 0)}, rate limited {counters.get('fetch.rateLimited', 0)}, "
+          f"failures {counters.get('fetch.failures', 0)}, location errors {counters.get('locations.errors', 0)}")
+    for name, seconds in sorted(metrics["stages"].items(), key=lambda stage: -stage[1]):
+        print(f"  {name:<16}{seconds:>9.2f}s")
+
+    if args.keep:
+        print(f"Scratch directory kept at {workdir}")
+    else:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
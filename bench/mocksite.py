@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# Local stand-in for dining.ucla.edu, built from the pages in bench/fixtures.
+#
+#   python -m bench.mocksite --port 8080 --scale 10 --latency 0.05 --error-rate 0.01
+#   MUNCH_BASE_URL=http://127.0.0.1:8080 python -m src.thehill
+#
+# Serves the same three routes the scraper uses:
+#   /<hall slug>                   location page, dates from today on (--days)
+#   /<hall slug>?date=YYYY-MM-DD   date page, every recipe card cloned --scale times
+#   /menu-item/?recipe=<id>        detail page (a recipe fixture, picked by id)
+# Dish ids are stable per hall and card, so every date of a hall shares its dishes the
+# way the real site's do; --scale 1 is about today's dish count, --scale 10 ten times it.
+import argparse
+import logging
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+from zoneinfo import ZoneInfo
+
+from bench import corpus
+from src.thehill import LOCATIONS
+
+# Date page template per hall slug, the rest use the Bruin Plate one
+DATE_TEMPLATES = {
+    "/bruin-bowl": "date-bruin-bowl.html",
+    "/cafe-1919": "date-cafe-1919.html",
+}
+DEFAULT_DATE_TEMPLATE = "date-bruin-plate.html"
+# Generated dish ids start here, clear of the real site's
+FIRST_DISH_ID = 100000
+
+CARD = re.compile(r'<section class="recipe-card">.*?</section>\n?', re.S)
+RECIPE_LIST = re.compile(r'(<div class="recipe-list">\n?)((?:<section class="recipe-card">.*?</section>\n?)+)', re.S)
+RECIPE_ID = re.compile(r"recipe=\d+")
+DISH_NAME = re.compile(r"<h3>(.*?)</h3>")
+OPTIONS = re.compile(r"<option[^>]*>.*?</option>", re.S)
+SELECT = re.compile(r"(<select[^>]*>).*?(</select>)", re.S)
+
+
+class MockSite:
+    def __init__(self, scale: int = 1, days: int = 7, latency: float = 0.0, error_rate: float = 0.0,
+                 throttle_rate: float = 0.0, retry_after: int = 1, empty_select: tuple[str, ...] = (),
+                 seed: Optional[int] = None):
+        self.scale = scale
+        self.days = days
+        # Seconds per response, +-50%
+        self.latency = latency
+        # Share of responses that are a 503, and a 429 with Retry-After: retry_after
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        # Halls whose location page has no dates to pick from
+        self.empty_select = set(empty_select)
+        self.random = random.Random(seed)
+        self.slugs = [loc_data[0] for loc_data in LOCATIONS.values()]
+        self._pages: dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.statuses: dict[int, int] = {}
+
+    def location_page(self, slug: str) -> str:
+        today = datetime.now(ZoneInfo("America/Los_Angeles"))
+        options = "" if slug in self.empty_select else "".join(
+            f'<option value="{day:%Y-%m-%d}">{day:%A, %B %-d}</option>'
+            for day in (today + timedelta(days=n) for n in range(self.days))
+        )
+        return SELECT.sub(lambda m: m.group(1) + options + m.group(2), corpus.load(corpus.LOCATION_PAGES[0]), count=1)
+
+    def date_page(self, slug: str) -> str:
+        # Same menu every date, generated once per hall
+        if slug in self._pages:
+            return self._pages[slug]
+        template = corpus.load(DATE_TEMPLATES.get(slug, DEFAULT_DATE_TEMPLATE))
+        cards_per_page = len(CARD.findall(template))
+        serial = iter(range(cards_per_page))
+        first = FIRST_DISH_ID + self.slugs.index(slug) * cards_per_page * self.scale
+
+        def clone(card: str) -> str:
+            base = first + next(serial) * self.scale
+            copies = []
+            for n in range(self.scale):
+                copy = RECIPE_ID.sub(f"recipe={base + n}", card)
+                if n:
+                    copy = DISH_NAME.sub(lambda m: f"<h3>{m.group(1)} {n + 1}</h3>", copy, count=1)
+                copies.append(copy)
+            return "".join(copies)
+
+        page = RECIPE_LIST.sub(lambda m: m.group(1) + CARD.sub(lambda c: clone(c.group(0)), m.group(2)), template)
+        self._pages[slug] = page
+        return page
+
+    def route(self, path: str, query: dict[str, list[str]]) -> Optional[str]:
+        if path.rstrip("/") == "/menu-item" and "recipe" in query:
+            return corpus.recipe_for(f"?recipe={query['recipe'][0]}")
+        slug = path.rstrip("/")
+        if slug not in self.slugs:
+            return None
+        if "date" in query:
+            return self.date_page(slug)
+        return self.location_page(slug)
+
+    def respond(self, url: str) -> tuple[int, dict[str, str], str]:
+        if self.latency:
+            time.sleep(self.latency * self.random.uniform(0.5, 1.5))
+        roll = self.random.random()
+        if roll < self.throttle_rate:
+            status, headers, body = 429, {"Retry-After": str(self.retry_after)}, "Too Many Requests"
+        elif roll < self.throttle_rate + self.error_rate:
+            status, headers, body = 503, {}, "Service Unavailable"
+        else:
+            parts = urlsplit(url)
+            body = self.route(parts.path, parse_qs(parts.query))
+            status, headers = (200, {}) if body is not None else (404, {})
+            body = body if body is not None else "Not Found"
+        with self._lock:
+            self.requests += 1
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+        return status, headers, body
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        status, headers, body = self.server.site.respond(self.path)
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=UTF-8")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logging.debug(format, *args)
+
+
+def serve(site: MockSite, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    # Starts the server on a background thread; port 0 picks a free one (server.server_port)
+    server = ThreadingHTTPServer((host, port), MockHandler)
+    server.daemon_threads = True
+    server.site = site
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_site_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--scale", type=int, default=1, help="copies of every recipe card (dish count multiplier)")
+    parser.add_argument("--days", type=int, default=7, help="dates listed on each location page")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per response (+-50%%)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of responses that are a 503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of responses that are a 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with a 429")
+    parser.add_argument("--empty-select", action="append", default=[], metavar="SLUG",
+                        help="hall (e.g. /bruin-bowl) whose location page lists no dates")
+    parser.add_argument("--seed", type=int)
+
+
+def site_from_args(args: argparse.Namespace) -> MockSite:
+    return MockSite(args.scale, args.days, args.latency, args.error_rate, args.throttle_rate, args.retry_after,
+                    tuple(args.empty_select), args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m bench.mocksite")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    add_site_arguments(parser)
+    args = parser.parse_args()
+
+    site = site_from_args(args)
+    server = serve(site, args.host, args.port)
+    print(f"Serving on http://{args.host}:{server.server_port} "
+          f"(MUNCH_BASE_URL=http://{args.host}:{server.server_port}), Ctrl-C to stop")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    server.shutdown()
+    print(f"{site.requests} requests, statuses {dict(sorted(site.statuses.items()))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import re
+
+
+# Frozen copy of the original src.thehill.sanitize_name, kept as the oracle for
+# the differential check in `python -m bench`
+def sanitize_name(name: str) -> str:
+    name = name.strip().lower()  # Only lowercase
+    s = name.split(" ")
+
+    # Remove any words with numbers or special characters
+    s = [word for word in s if not re.match(r".*[0-9].*", word) and not re.match(r".*[^a-zA-Z].*", word)]
+
+    # Remove any of these
+    ABBRS = ["oz", "lb", "ct", "select",
+             "sp"]  # ["g", "kg", "ml", "l", "tbsp", "tsp", "cup", "pint", "quart", "gallon"]
+    s = [word for word in s if word not in ABBRS]
+
+    # Move any color words to the beginning of the list
+    COLORS = ["red", "blue", "green", "yellow", "orange", "purple", "pink", "black", "white", "brown", "gray", "silver",
+              "gold"]
+    s = [word for word in s if word in COLORS] + [word for word in s if word not in COLORS]
+
+    # Move any word ending in "ed" to the start of the list
+    s = [word for word in s if re.match(r".*[Ee]d.*", word)] + [word for word in s if not re.match(r".*[Ee]d.*", word)]
+
+    # Move any word in the following list to the start of the list
+    CUSTOM_START_WORDS = ["fresh"]
+    s = [word for word in s if word in CUSTOM_START_WORDS] + [word for word in s if word not in CUSTOM_START_WORDS]
+
+    # Move any word in the following list to the end of the list
+    CUSTOM_END_WORDS = ["gelato"]
+    s = [word for word in s if word not in CUSTOM_END_WORDS] + [word for word in s if word in CUSTOM_END_WORDS]
+
+    # Recreate word
+    return " ".join(s).title()
+
+
+# How a dish's models were validated before src.models' validate-once policy: every
+# nutrition entry and ingredient as its own model, then the aggregates around them
+def validate_dish(name: str, dish_id: int, labels: list, ingredients: list, nutrition: dict):
+    from src.models import MunchDish, MunchIngredient, MunchNutrition, MunchNutritionEntry
+    mn = {key: MunchNutritionEntry(**value) if isinstance(value, dict) else value for key, value in nutrition.items()}
+    return MunchDish(
+            name=name,
+            id=dish_id,
+            labels=labels,
+            ingredients=[MunchIngredient(**ingredient) for ingredient in ingredients],
+            nutrition=MunchNutrition.model_validate(mn),
+    )
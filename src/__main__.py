@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# python -m src <command>
+#
+#   python -m src hill                                           full scrape of every hall
+#   python -m src hill --location "bruin plate" --date 2026-10-17  rescrape one hall's day
+#   python -m src hill --location 866 --dishes-only               refetch one hall's dishes
+#   python -m src daemon --today-every 5 --full-every 360        keep scraping, caches warm
+#   python -m src swipes | exceptions | publish
+#
+# Each command imports only the modules it needs, so `python -m src --help` and the
+# small commands don't pay for bs4, pydantic and the models up front.
+import argparse
+import logging
+import sys
+from datetime import date
+
+
+def parse_date(value: str) -> date:
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected YYYY-MM-DD, got {value!r}")
+
+
+def run_hill(args: argparse.Namespace):
+    from src import thehill
+
+    only = None
+    if args.location:
+        only = []
+        for value in args.location:
+            location_id = thehill.find_location(value)
+            if location_id is None:
+                sys.exit(f"Unknown location {value!r}, expected one of: {', '.join(thehill.LOCATIONS)}")
+            only.append(location_id)
+    dates = set(args.date) if args.date else None
+    thehill.main(only, dates, dishes_only=args.dishes_only, clusters=not args.no_clusters,
+                 publish_artifacts=thehill.PUBLISH_ENABLED and not args.no_publish)
+
+
+def run_daemon(args: argparse.Namespace):
+    from src import daemon
+    daemon.main(daemon.TODAY_MINUTES if args.today_every is None else args.today_every,
+                daemon.FULL_MINUTES if args.full_every is None else args.full_every)
+
+
+def run_swipes(args: argparse.Namespace):
+    from src import mealswipes
+    mealswipes.main()
+
+
+def run_exceptions(args: argparse.Namespace):
+    from src import exceptions
+    exceptions.main()
+
+
+def run_publish(args: argparse.Namespace):
+    from src import publish
+    publish.main()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m src")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    hill = sub.add_parser("hill", help="scrape dining hall menus (data/thehill.json, meals, clusters)")
+    hill.add_argument("--location", action="append", metavar="NAME|ID|SLUG",
+                      help="only this hall (repeatable); merged into the existing output")
+    hill.add_argument("--date", action="append", type=parse_date, metavar="YYYY-MM-DD",
+                      help="only this date (repeatable); other dates keep the last run's menus")
+    hill.add_argument("--dishes-only", action="store_true",
+                      help="refetch every dish on the selected menus, leave the menus themselves alone")
+    hill.add_argument("--no-clusters", action="store_true", help="don't rebuild data/mealclusters/")
+    hill.add_argument("--no-publish", action="store_true", help="don't update data/dist/")
+    hill.set_defaults(run=run_hill)
+
+    daemon = sub.add_parser("daemon", help="scrape on a schedule in one long-running process")
+    daemon.add_argument("--today-every", type=float, metavar="MINUTES",
+                        help="rescrape today's menus this often (default: MUNCH_DAEMON_TODAY_MINUTES or 5)")
+    daemon.add_argument("--full-every", type=float, metavar="MINUTES",
+                        help="full crawl this often (default: MUNCH_DAEMON_FULL_MINUTES or 360)")
+    daemon.set_defaults(run=run_daemon)
+
+    sub.add_parser("swipes", help="scrape meal plan swipe counts").set_defaults(run=run_swipes)
+    sub.add_parser("exceptions", help="write data/exceptions.json").set_defaults(run=run_exceptions)
+    sub.add_parser("publish", help="re-publish data/ to data/dist/ without scraping").set_defaults(run=run_publish)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import json
+import logging
+import os
+from typing import Iterable, List
+
+from src.output import JsonArrayWriter, write_atomic
+from src.store import DishStore
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+MEALCLUSTERS_FILE_PREFIX = os.path.join(DATA_DIR, "mealclusters")
+MEALCLUSTERS_CACHE_FILE = os.path.join(MEALCLUSTERS_FILE_PREFIX, "_cache.json")
+
+
+class ClusterBuilder:
+    # data/mealclusters/<hall>.json is every dish served at a hall, in id order.
+    # A hall's file is only rebuilt when its membership changed or one of its dishes
+    # did, and only written when the bytes differ from what's already on disk.
+    def __init__(self, store: DishStore, prefix: str = MEALCLUSTERS_FILE_PREFIX,
+                 cache_file: str = MEALCLUSTERS_CACHE_FILE):
+        self.store = store
+        self.prefix = prefix
+        self.cache_file = cache_file
+        self.previous: dict[int, set[int]] = {}
+        if os.path.exists(cache_file):
+            with open(cache_file, "r") as f:
+                self.previous = {int(hall_id): set(dish_ids) for hall_id, dish_ids in json.load(f).items()}
+        self.members: dict[int, set[int]] = {}
+        # id -> serialized dish, loaded from the store once and shared by every hall (and,
+        # in the daemon, every run until the dish changes)
+        self.dishes: dict[int, str] = {}
+
+    def set_members(self, hall_id: int, dish_ids: Iterable[int]):
+        self.members[hall_id] = set(dish_ids)
+
+    def _serialized(self, dish_ids: List[int]) -> List[str]:
+        missing = [dish_id for dish_id in dish_ids if dish_id not in self.dishes]
+        if missing:
+            for dish_id, payload in self.store.get_many(missing).items():
+                self.dishes[dish_id] = json.dumps(json.loads(payload))
+        return [self.dishes[dish_id] for dish_id in dish_ids]
+
+    def build(self, changed_dish_ids: Iterable[int]) -> List[int]:
+        changed = set(changed_dish_ids)
+        for dish_id in changed:
+            self.dishes.pop(dish_id, None)
+        written = []
+        # Halls that failed to scrape this run keep their previous membership
+        membership = self.previous | self.members
+        for hall_id, dish_ids in membership.items():
+            cluster_path = os.path.join(self.prefix, f"{hall_id}.json")
+            old = self.previous.get(hall_id)
+            if os.path.exists(cluster_path) and old == dish_ids and not (dish_ids & changed):
+                continue
+
+            with JsonArrayWriter(cluster_path, skip_if_unchanged=True) as out:
+                for j in self._serialized(sorted(dish_ids)):
+                    out.write_raw(j)
+            if not out.changed:
+                continue
+            written.append(hall_id)
+            logging.info(f"Rebuilt meal cluster {hall_id} ({len(dish_ids)} dishes, "
+                         f"+{len(dish_ids - (old or set()))} -{len((old or set()) - dish_ids)})")
+
+        write_atomic(self.cache_file, json.dumps({hall_id: sorted(dish_ids) for hall_id, dish_ids in membership.items()}))
+        self.previous = membership
+        self.members = {}
+        return written
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+import logging
+import os
+import signal
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from src import thehill
+
+# Minutes between rescrapes of today's menus, and between full crawls (every hall, every date)
+TODAY_MINUTES = float(os.environ.get("MUNCH_DAEMON_TODAY_MINUTES", "5"))
+FULL_MINUTES = float(os.environ.get("MUNCH_DAEMON_FULL_MINUTES", "360"))
+
+
+class ScraperDaemon:
+    # Runs thehill over and over in one process with one ScrapeContext, so the dish
+    # store, indexes, cluster membership, fingerprints, parse workers and the HTTP
+    # session's connections stay warm between runs. Starts with a full crawl; in between
+    # full crawls, today's pages are rescraped (unchanged pages are skipped by their
+    # fingerprint) and merged into the outputs.
+    def __init__(self, today_minutes: float = TODAY_MINUTES, full_minutes: float = FULL_MINUTES):
+        self.today_every = today_minutes * 60
+        self.full_every = full_minutes * 60
+        self.ctx = thehill.ScrapeContext()
+        self.next_today = 0.0
+        self.next_full = 0.0
+        self.stopping = False
+
+    def stop(self, *_):
+        logging.info("Stopping after the current run")
+        self.stopping = True
+
+    def run_once(self):
+        # Whichever run is due; the schedule moves on even if the run fails
+        now = time.monotonic()
+        if now >= self.next_full:
+            self.next_full = now + self.full_every
+            self.next_today = now + self.today_every
+            logging.info("Full crawl")
+            thehill.main(ctx=self.ctx)
+        elif now >= self.next_today:
+            self.next_today = now + self.today_every
+            today = datetime.now(ZoneInfo("America/Los_Angeles")).date()
+            logging.info(f"Refreshing today's menus ({today})")
+            thehill.main(dates={today}, force=False, ctx=self.ctx)
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.ctx.open()
+        try:
+            while not self.stopping:
+                try:
+                    self.run_once()
+                except Exception:
+                    logging.exception("Scrape failed, trying again on the next schedule")
+                while not self.stopping and time.monotonic() < min(self.next_today, self.next_full):
+                    time.sleep(1)
+        finally:
+            self.ctx.close()
+
+
+def main(today_minutes: float = TODAY_MINUTES, full_minutes: float = FULL_MINUTES):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    logging.info(f"Scraper daemon: today's menus every {today_minutes:g} min, full crawl every {full_minutes:g} min")
+    ScraperDaemon(today_minutes, full_minutes).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ import json
 import os
 
 from src.models import *
+from src.output import write_atomic
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
 
@@ -63,8 +64,7 @@ def main():
             }
     )
 
-    with open(os.path.join(DATA_DIR, f"exceptions.json"), "w") as f:
-        f.write(j)
+    write_atomic(os.path.join(DATA_DIR, f"exceptions.json"), j)
 
 
 if __name__ == "__main__":
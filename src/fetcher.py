@@ -0,0 +1,40 @@
+import asyncio
+import logging
+from typing import Iterable
+from urllib.parse import urlsplit
+
+from src.util import fetch
+
+# Max in-flight requests per host, be nice to dining.ucla.edu
+DEFAULT_PER_HOST = 4
+
+
+class AsyncFetcher:
+    def __init__(self, per_host: int = DEFAULT_PER_HOST):
+        self.per_host = max(1, per_host)
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+
+    def _semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._semaphores:
+            self._semaphores[host] = asyncio.Semaphore(self.per_host)
+        return self._semaphores[host]
+
+    async def fetch(self, url: str) -> str:
+        async with self._semaphore(url):
+            # fetch() is blocking (requests), so run it on the default thread pool
+            return await asyncio.to_thread(fetch, url)
+
+    async def fetch_all(self, urls: list[str]) -> list[str | BaseException]:
+        return await asyncio.gather(*(self.fetch(url) for url in urls), return_exceptions=True)
+
+
+def fetch_many(urls: Iterable[str], per_host: int = DEFAULT_PER_HOST) -> dict[str, str | BaseException]:
+    # Failures are returned (not raised) so the caller can surface them at the same
+    # point the sequential path would have
+    urls = list(dict.fromkeys(urls))
+    if len(urls) == 0:
+        return {}
+    logging.info(f"Fetching {len(urls)} pages ({per_host} per host)")
+    results = asyncio.run(AsyncFetcher(per_host).fetch_all(urls))
+    return dict(zip(urls, results))
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+import argparse
+import bisect
+import json
+import logging
+import os
+import time
+from typing import Iterable, Optional
+
+from src.models import MunchLocation, construct
+from src.output import write_atomic
+from src.store import DishStore, open_store
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+INDEXES_FILE = os.path.join(DATA_DIR, "indexes.json")
+THEHILL_FILE = os.path.join(DATA_DIR, "thehill.json")
+
+
+def to_bitmap(ids: Iterable[int]) -> int:
+    bitmap = 0
+    for dish_id in ids:
+        bitmap |= 1 << dish_id
+    return bitmap
+
+
+def to_bitmap_union(bitmaps: Iterable[int]) -> int:
+    union = 0
+    for bitmap in bitmaps:
+        union |= bitmap
+    return union
+
+
+def from_bitmap(bitmap: int) -> list[int]:
+    # Scanning the binary string is several times faster than peeling bits off the int
+    bits = bin(bitmap)[:1:-1]
+    ids = []
+    i = bits.find("1")
+    while i != -1:
+        ids.append(i)
+        i = bits.find("1", i + 1)
+    return ids
+
+
+def menu_key(location_id: int, date: str, period: str) -> str:
+    return f"{location_id}/{date}/{period}"
+
+
+class DishIndex:
+    # Inverted indexes over the dish store, persisted to data/indexes.json:
+    #   labels       label -> bitmap of dish ids (bit n set = dish n has the label)
+    #   ingredients  lowercased ingredient name -> sorted dish ids
+    #   menus        "<location id>/<y-m-d>/<period>" -> dish ids on that menu
+    # Bitmaps are Python ints, so include/exclude queries are a handful of &, | and ~.
+    def __init__(self):
+        self.dishes = 0
+        self.labels: dict[str, int] = {}
+        self.ingredients: dict[str, list[int]] = {}
+        self.menus: dict[str, list[int]] = {}
+
+    @classmethod
+    def load(cls, path: str = INDEXES_FILE) -> Optional["DishIndex"]:
+        if not os.path.exists(path):
+            return None
+        with open(path, "r") as f:
+            data = json.load(f)
+        index = cls()
+        index.dishes = int(data["dishes"], 16)
+        index.labels = {label: int(bitmap, 16) for label, bitmap in data["labels"].items()}
+        index.ingredients = data["ingredients"]
+        index.menus = data["menus"]
+        return index
+
+    def save(self, path: str = INDEXES_FILE):
+        write_atomic(path, json.dumps({
+            "dishes": f"{self.dishes:x}",
+            "labels": {label: f"{self.labels[label]:x}" for label in sorted(self.labels)},
+            "ingredients": {name: self.ingredients[name] for name in sorted(self.ingredients)},
+            "menus": self.menus,
+        }))
+
+    def update(self, payloads: dict[int, str]):
+        # Re-indexes the given dishes: their old postings are dropped in one pass,
+        # then their current labels and ingredients are added back
+        if not payloads:
+            return
+        changed = set(payloads)
+        mask = to_bitmap(changed)
+        for label in self.labels:
+            self.labels[label] &= ~mask
+        for name, ids in list(self.ingredients.items()):
+            if changed.isdisjoint(ids):
+                continue
+            ids = [dish_id for dish_id in ids if dish_id not in changed]
+            if ids:
+                self.ingredients[name] = ids
+            else:
+                del self.ingredients[name]
+
+        self.dishes |= mask
+        for dish_id in sorted(changed):
+            dish = json.loads(payloads[dish_id])
+            bit = 1 << dish_id
+            for label in dish["labels"]:
+                self.labels[label] = self.labels.get(label, 0) | bit
+            for name in {ingredient["name"].lower() for ingredient in dish["ingredients"]}:
+                bisect.insort(self.ingredients.setdefault(name, []), dish_id)
+
+    def set_menus(self, location: MunchLocation):
+        # Replaces every menu of this location with the freshly scraped ones
+        prefix = f"{location.id}/"
+        self.menus = {key: ids for key, ids in self.menus.items() if not key.startswith(prefix)}
+        for location_date in location.dates:
+            date = f"{location_date.date.y}-{location_date.date.m}-{location_date.date.d}"
+            for period in location_date.periods:
+                ids = dict.fromkeys(dish for station in period.stations for dish in station.dishes)
+                self.menus[menu_key(location.id, date, period.name)] = list(ids)
+
+    def dishes_on(self, date: str) -> set[int]:
+        # Every dish on any menu of the given "y-m-d"
+        return {dish_id for key, ids in self.menus.items() if key.split("/")[1] == date for dish_id in ids}
+
+    def query(self, include: Iterable[str] = (), exclude: Iterable[str] = (), any_of: Iterable[str] = (),
+              without_ingredients: Iterable[str] = (), menu: Optional[str] = None) -> list[int]:
+        # Dish ids with every label in include, none in exclude, at least one of any_of
+        # (if given), none of without_ingredients, and on the given menu (if given)
+        bitmap = self.dishes if menu is None else to_bitmap(self.menus.get(menu, []))
+        for label in include:
+            bitmap &= self.labels.get(label, 0)
+        for label in exclude:
+            bitmap &= ~self.labels.get(label, 0)
+        any_of = list(any_of)
+        if any_of:
+            bitmap &= to_bitmap_union(self.labels.get(label, 0) for label in any_of)
+        for name in without_ingredients:
+            bitmap &= ~to_bitmap(self.ingredients.get(name.lower(), []))
+        return from_bitmap(bitmap)
+
+
+def build(store: DishStore) -> DishIndex:
+    index = DishIndex()
+    index.update(dict(store.items()))
+    return index
+
+
+def open_index(store: DishStore, path: str = INDEXES_FILE) -> DishIndex:
+    # Without an index file yet, everything in the store gets indexed once
+    index = DishIndex.load(path)
+    if index is None:
+        index = build(store)
+        logging.info(f"Indexed {len(store)} dishes from the store")
+    return index
+
+
+def main():
+    # python -m src.indexes build
+    # python -m src.indexes query --include Vegan --exclude Pork --exclude Peanut --menu 866/2026-8-22/Dinner
+    parser = argparse.ArgumentParser(prog="python -m src.indexes")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("build", help="rebuild the label and ingredient indexes from the dish store")
+    query = sub.add_parser("query", help="dish ids matching the given labels/ingredients")
+    query.add_argument("--include", action="append", default=[], metavar="LABEL")
+    query.add_argument("--exclude", action="append", default=[], metavar="LABEL")
+    query.add_argument("--any", action="append", default=[], metavar="LABEL")
+    query.add_argument("--without-ingredient", action="append", default=[], metavar="NAME")
+    query.add_argument("--menu", metavar="LOCATION/Y-M-D/PERIOD")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+        store = open_store()
+        index = build(store)
+        store.close()
+        if os.path.exists(THEHILL_FILE):
+            with open(THEHILL_FILE, "r") as f:
+                for location in json.load(f):
+                    index.set_menus(construct(MunchLocation, location))
+        index.save()
+        return
+
+    index = DishIndex.load()
+    if index is None:
+        print(f"No index at {INDEXES_FILE}, run `python -m src.indexes build` first")
+        return
+    start = time.perf_counter()
+    ids = index.query(args.include, args.exclude, args.any, args.without_ingredient, args.menu)
+    elapsed = time.perf_counter() - start
+    print(" ".join(map(str, ids)))
+    print(f"{len(ids)} dishes in {elapsed * 1e6:.0f} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import json
+import logging
+import os
+import threading
+from typing import Optional
+
+from src.output import write_atomic
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+JOURNAL_FILE = os.path.join(DATA_DIR, "_journal.jsonl")
+
+
+class Journal:
+    # Append-only record of a run in progress, one JSON object per line, flushed as it's
+    # written:
+    #   {"run": "<y>-<m>-<d>"}                               first line
+    #   {"page": "<location id>/<y>-<m>-<d>", "entry": ...}   a parsed date (FINGERPRINTS entry)
+    #   {"dish": <id>, "changed": bool}                        a dish fetched into the store
+    # A run that finishes deletes it. A run that finds one left behind picks up its pages
+    # and dishes instead of fetching them again (pages only if it's still the same day).
+    def __init__(self, path: str = JOURNAL_FILE):
+        self.path = path
+        self.pages: dict[str, dict] = {}
+        self.dishes: dict[int, bool] = {}
+        self._lock = threading.Lock()
+        self._f = None
+
+    def open(self, run: str) -> "Journal":
+        self._replay(run)
+        # Rewrite what's still usable under this run's header, then keep appending
+        lines = [{"run": run}]
+        lines += [{"page": key, "entry": entry} for key, entry in self.pages.items()]
+        lines += [{"dish": dish_id, "changed": changed} for dish_id, changed in self.dishes.items()]
+        write_atomic(self.path, "".join(json.dumps(line) + "\n" for line in lines))
+        self._f = open(self.path, "a")
+        return self
+
+    def _replay(self, run: str):
+        if not os.path.exists(self.path):
+            return
+        same_run = False
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # The line being written when the last run died
+                    continue
+                if "run" in record:
+                    same_run = record["run"] == run
+                elif "page" in record:
+                    if same_run:
+                        self.pages[record["page"]] = record["entry"]
+                elif "dish" in record:
+                    self.dishes[record["dish"]] = self.dishes.get(record["dish"], False) or record["changed"]
+        if self.pages or self.dishes:
+            logging.info(f"Resuming an unfinished run: {len(self.pages)} pages and {len(self.dishes)} dishes "
+                         f"from {self.path}")
+
+    def _append(self, record: dict):
+        with self._lock:
+            if self._f is None:
+                return
+            self._f.write(json.dumps(record) + "\n")
+            self._f.flush()
+
+    def page(self, key: str, entry: dict):
+        self._append({"page": key, "entry": entry})
+
+    def dish(self, dish_id: int, changed: bool):
+        self._append({"dish": dish_id, "changed": changed})
+
+    def finish(self):
+        # Everything it covered has been written out
+        with self._lock:
+            if self._f is not None:
+                self._f.close()
+                self._f = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def close(self):
+        # Leaves the journal behind for the next run
+        with self._lock:
+            if self._f is not None:
+                self._f.close()
+                self._f = None
+
+
+def open_journal(run: str, path: Optional[str] = None) -> Journal:
+    return Journal(path or JOURNAL_FILE).open(run)
@@ -0,0 +1,65 @@
+import functools
+import json
+import os
+import re
+from typing import Iterable, List
+
+from src.models import LABEL
+
+# Submit a PR if the rules in label_rules.json are not exhaustive or trigger false positives
+RULES_FILE = os.path.join(os.path.dirname(__file__), "label_rules.json")
+
+
+class LabelClassifier:
+    # Every keyword of every rule goes into one regex. Each match is a zero-width
+    # lookahead, so overlapping keywords ("short rib" / "rib") are all seen in one scan.
+    def __init__(self, rules: dict[str, dict]):
+        self.labels: List[LABEL] = list(rules)
+        self.unless = {label: [s.lower() for s in rule.get("unless", [])] for label, rule in rules.items()}
+
+        term_labels: dict[str, set[str]] = {}
+        for label, rule in rules.items():
+            for term in rule["matches"]:
+                term_labels.setdefault(term.lower(), set()).add(label)
+        # Longest first, so at any position the regex reports the longest keyword. Shorter
+        # keywords that end on a word boundary inside it ("short" in "short rib") match at
+        # the same spot, so the longer keyword carries their labels as well.
+        terms = sorted(term_labels, key=len, reverse=True)
+        # Indexed by regex group, one group per keyword
+        self.group_labels = [set()] + [
+            {
+                label
+                for other in terms
+                if other == term or re.match(rf"\b{re.escape(other)}\b", term, re.I)
+                for label in term_labels[other]
+            }
+            for term in terms
+        ]
+        alternation = "|".join(f"({re.escape(term)})" for term in terms)
+        self.pattern = re.compile(rf"(?=\b(?:{alternation})\b)", re.I)
+
+    @functools.lru_cache(maxsize=8192)
+    def _classify(self, name: str) -> tuple[LABEL, ...]:
+        found = set()
+        for m in self.pattern.finditer(name):
+            found |= self.group_labels[m.lastindex]
+            if len(found) == len(self.labels):
+                break
+        return tuple(
+            label for label in self.labels
+            if label in found and not any(s in name for s in self.unless[label])
+        )
+
+    def classify(self, name: str) -> List[LABEL]:
+        return list(self._classify(name.lower().strip()))
+
+    def classify_many(self, names: Iterable[str]) -> List[List[LABEL]]:
+        return [self.classify(name) for name in names]
+
+
+def load_classifier(path: str = RULES_FILE) -> LabelClassifier:
+    with open(path, "r") as f:
+        return LabelClassifier(json.load(f))
+
+
+LABEL_CLASSIFIER = load_classifier()
@@ -1,17 +1,15 @@
 #!/usr/bin/env python3
-import json
 import logging
 import os
 import re
 
-from bs4 import BeautifulSoup, Tag
+from bs4 import Tag
 
 from src.models import *
+from src.output import JsonArrayWriter
+from src.parsing import make_soup
 from src.util import *
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
-
 DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
 
 LINKS = {
@@ -43,37 +41,42 @@ MAP_PERIOD_TO_NUM = {
 }
 
 
+def parse_meal_plan(soup: Tag, key: str) -> tuple[str, MunchMealPlan]:
+    body = soup.select_one("div[itemprop=\"articleBody\"]")
+    ps = body.select("p")
+    p0 = ps[0].get_text(strip=True)
+    s = [x.strip() for x in p0.split(".")]
+    m = re.search(r".+(11|14|19)P[A-Za-z\s]+(\d+)[A-Za-z\s]+", s[0])
+    level = int(m.group(1))
+    total = int(m.group(2))
+    p2 = ps[2].get_text(strip=True)
+    m2 = re.search(
+        r".+(Fall|Winter|Spring).+(breakfast|lunch|dinner).+(January|February|March|April|May|June|July|August|September|October|November|December) (\d{1,2}), (\d{4}).+(breakfast|lunch|dinner).+(January|February|March|April|May|June|July|August|September|October|November|December) (\d{1,2}), (\d{4})",
+        p2)
+    quarter = m2.group(1)
+    start_date = MunchDate(y=int(m2.group(5)), m=MAP_MONTH_TO_NUM[m2.group(3)], d=int(m2.group(4)))
+    end_date = MunchDate(y=int(m2.group(9)), m=MAP_MONTH_TO_NUM[m2.group(7)], d=int(m2.group(8)))
+    return quarter, MunchMealPlan(amt=int(key.replace("P", "")), type="P", startPeriod=MAP_PERIOD_TO_NUM[m2.group(2)],
+                                  startDate=start_date, endPeriod=MAP_PERIOD_TO_NUM[m2.group(6)], endDate=end_date,
+                                  totalSwipes=total)
+
+
 def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
     data = []
     quarter: Optional[Literal["Fall", "Winter", "Spring"]] = None
 
     for key, value in LINKS.items():
-        soup = BeautifulSoup(fetch(value), "html.parser")
-        body = soup.select_one("div[itemprop=\"articleBody\"]")
-        ps = body.select("p")
-        p0 = ps[0].get_text(strip=True)
-        s = [x.strip() for x in p0.split(".")]
-        m = re.search(r".+(11|14|19)P[A-Za-z\s]+(\d+)[A-Za-z\s]+", s[0])
-        level = int(m.group(1))
-        total = int(m.group(2))
-        p2 = ps[2].get_text(strip=True)
-        m2 = re.search(
-            r".+(Fall|Winter|Spring).+(breakfast|lunch|dinner).+(January|February|March|April|May|June|July|August|September|October|November|December) (\d{1,2}), (\d{4}).+(breakfast|lunch|dinner).+(January|February|March|April|May|June|July|August|September|October|November|December) (\d{1,2}), (\d{4})",
-            p2)
-        quarter = m2.group(1)
-        start_date = MunchDate(y=int(m2.group(5)), m=MAP_MONTH_TO_NUM[m2.group(3)], d=int(m2.group(4)))
-        end_date = MunchDate(y=int(m2.group(9)), m=MAP_MONTH_TO_NUM[m2.group(7)], d=int(m2.group(8)))
-        data.append(MunchMealPlan(amt=int(key.replace("P", "")), type="P", startPeriod=MAP_PERIOD_TO_NUM[m2.group(2)],
-                                  startDate=start_date, endPeriod=MAP_PERIOD_TO_NUM[m2.group(6)], endDate=end_date,
-                                  totalSwipes=total))
+        soup = make_soup(fetch(value), "article")
+        quarter, plan = parse_meal_plan(soup, key)
+        data.append(plan)
 
     if not quarter:
         logging.error("Quarter not found")
         return
 
-    j = json.dumps([json.loads(entry.model_dump_json()) for entry in data])
-    with open(os.path.join(DATA_DIR, f"mealswipes-{quarter.lower()}.json"), "w") as f:
-        f.write(j)
+    with JsonArrayWriter(os.path.join(DATA_DIR, f"mealswipes-{quarter.lower()}.json")) as out:
+        out.write_all(data)
 
 
 if __name__ == "__main__":
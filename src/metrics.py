@@ -0,0 +1,94 @@
+import cProfile
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional
+
+from src.output import write_atomic
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+METRICS_FILE = os.path.join(DATA_DIR, "metrics.json")
+PROFILE_FILE = os.path.join(DATA_DIR, "profile.pstats")
+
+
+class Metrics:
+    # Counters and stage timers for one run, written to data/metrics.json at the end (not
+    # committed, the workflow uploads it as an artifact of the run).
+    # Stage times are self times: a "fetch" inside a "parse" counts toward fetch only.
+    # Fetches on the concurrent engine's threads are summed, so with MUNCH_CONCURRENCY > 1
+    # stage totals can add up to more than the wall time.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        # Starts over for a new run (e.g. the next one in the daemon)
+        with self._lock:
+            self.started_at = datetime.now(timezone.utc)
+            self._start = time.perf_counter()
+            self.counters: dict[str, int] = {}
+            self.stages: dict[str, float] = {}
+            self.locations: dict[str, dict] = {}
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextmanager
+    def stage(self, name: str):
+        stack = self._local.__dict__.setdefault("stack", [])
+        # [name, start, time spent in nested stages]
+        frame = [name, time.perf_counter(), 0.0]
+        stack.append(frame)
+        try:
+            yield
+        finally:
+            stack.pop()
+            elapsed = time.perf_counter() - frame[1]
+            if stack:
+                stack[-1][2] += elapsed
+            with self._lock:
+                self.stages[name] = self.stages.get(name, 0.0) + elapsed - frame[2]
+
+    def location(self, name: str, seconds: float, **fields):
+        with self._lock:
+            self.locations[name] = {"seconds": round(seconds, 3), **fields}
+
+    def to_dict(self) -> dict:
+        return {
+            "startedAt": self.started_at.isoformat(timespec="seconds"),
+            "wallSeconds": round(time.perf_counter() - self._start, 3),
+            "stages": {name: round(seconds, 3) for name, seconds in sorted(self.stages.items())},
+            "counters": dict(sorted(self.counters.items())),
+            "locations": self.locations,
+        }
+
+    def write(self, path: str = METRICS_FILE):
+        write_atomic(path, json.dumps(self.to_dict(), indent=2) + "\n")
+
+
+METRICS = Metrics()
+
+
+@contextmanager
+def profiled(path: Optional[str] = None):
+    # MUNCH_PROFILE=1 dumps a cProfile of the block to data/profile.pstats,
+    # MUNCH_PROFILE=<file> to that file. Read it with `python -m pstats <file>`.
+    target = os.environ.get("MUNCH_PROFILE", "")
+    if target in ("", "0"):
+        yield
+        return
+    path = path or (PROFILE_FILE if target == "1" else target)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        logging.info(f"Profile written to {path}")
@@ -1,5 +1,6 @@
-from typing import List, Optional, Literal, Annotated
-from pydantic import BaseModel, Field
+from types import NoneType, UnionType
+from typing import List, Optional, Literal, Annotated, Type, TypeVar, Union, get_args, get_origin
+from pydantic import BaseModel, Field, TypeAdapter
 
 LABEL = Literal[
     "Vegetarian", "Vegan", "Gluten", "Dairy", "Eggs", "Wheat", "Halal", "Soy", "Sesame", "Peanut", "Alcohol", "Fish", "Crustacean-Shellfish", "Tree-Nuts", "Low-Carbon", "High-Carbon", "Pork", "Beef", "Chicken"]
@@ -132,3 +133,42 @@ class MunchDiningHallException(BaseModel):
     startDate: Optional[MunchDate] = None
     endDate: Optional[MunchDate] = None
     specifics: Optional[List[MunchDate]] = None
+
+
+##########################################################################################
+
+# ---- Validation ----
+# Scraped values are validated once per aggregate (a dish's nutrition dict, a dish's
+# ingredient list, an hours table) where they leave the parser. Models assembled from
+# already-validated models aren't validated again (pydantic passes instances through),
+# and our own stored output is rebuilt with construct() instead of model_validate().
+
+MunchIngredientList = TypeAdapter(List[MunchIngredient])
+
+M = TypeVar("M", bound=BaseModel)
+
+
+def _construct_value(annotation, value):
+    if value is None:
+        return None
+    origin = get_origin(annotation)
+    if origin in (Union, UnionType):
+        args = [arg for arg in get_args(annotation) if arg is not NoneType]
+        return _construct_value(args[0], value) if len(args) == 1 else value
+    if origin is list:
+        (arg,) = get_args(annotation)
+        return [_construct_value(arg, v) for v in value]
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel) and isinstance(value, dict):
+        return construct(annotation, value)
+    return value
+
+
+def construct(model: Type[M], data: dict) -> M:
+    # Trusted path: rebuilds a model tree from data that already passed validation
+    # (e.g. a model_dump() we wrote ourselves) without validating it again
+    values = {}
+    for name, field in model.model_fields.items():
+        key = field.alias if field.alias in data else name
+        if key in data:
+            values[name] = _construct_value(field.annotation, data[key])
+    return model.model_construct(**values)
@@ -0,0 +1,33 @@
+import functools
+
+# Dropped outright
+ABBRS = {"oz", "lb", "ct", "select", "sp"}  # {"g", "kg", "ml", "l", "tbsp", "tsp", "cup", "pint", "quart", "gallon"}
+COLORS = {"red", "blue", "green", "yellow", "orange", "purple", "pink", "black", "white", "brown", "gray", "silver",
+          "gold"}
+CUSTOM_START_WORDS = {"fresh"}
+CUSTOM_END_WORDS = {"gelato"}
+
+
+@functools.lru_cache(maxsize=16384)
+def word_rank(word: str) -> int:
+    # Where a word ends up, lowest first: "fresh", then "-ed" words, then colors,
+    # everything else, and "gelato" at the very end. Ties keep their original order.
+    # Words with digits or anything but ASCII letters get -1 and are dropped.
+    if (word and not (word.isascii() and word.isalpha())) or word in ABBRS:
+        return -1
+    return (
+            (word in CUSTOM_END_WORDS) << 3
+            | (word not in CUSTOM_START_WORDS) << 2
+            | ("ed" not in word) << 1
+            | (word not in COLORS)
+    )
+
+
+@functools.lru_cache(maxsize=8192)
+def sanitize_name(name: str) -> str:
+    buckets: list[list[str]] = [[] for _ in range(16)]
+    for word in name.strip().lower().split(" "):
+        rank = word_rank(word)
+        if rank >= 0:
+            buckets[rank].append(word)
+    return " ".join(word for bucket in buckets for word in bucket).title()
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import logging
+import os
+from typing import Hashable, Iterable, Optional
+
+import numpy as np
+
+from src.models import MunchLocation, MunchNutrition, MunchNutritionEntry, construct
+from src.output import tmp_path_for
+from src.store import DishStore, open_store
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+NUTRITION_FILE = os.path.join(DATA_DIR, "nutrition.npy")
+THEHILL_FILE = os.path.join(DATA_DIR, "thehill.json")
+
+# Every MunchNutritionEntry field of MunchNutrition, in model order. Amounts are in the
+# units the site uses (g, mg or µg per nutrient), same as the dish JSONs.
+NUTRIENTS = [
+    name for name, field in MunchNutrition.model_fields.items()
+    if MunchNutritionEntry in (field.annotation, *getattr(field.annotation, "__args__", ()))
+]
+
+# One row per dish: id, servingSize, calories, then <nutrient> (amount) and
+# <nutrient>_pdv for each nutrient. Missing optional entries are NaN / -1.
+DTYPE = np.dtype(
+        [("id", "<i8"), ("servingSize", "<f8"), ("calories", "<f8")]
+        + [(name, "<f8") for name in NUTRIENTS]
+        + [(f"{name}_pdv", "<i4") for name in NUTRIENTS]
+)
+
+
+class NutritionTable:
+    # Columnar view of every dish's nutrition, sorted by id. Filters work on whole
+    # columns at once and return dish ids, so they compose with the menu groups below.
+    #
+    #   table = NutritionTable.load()
+    #   ids = table.select(menu_ids(locations, location=866, period="Dinner"),
+    #                      min={"protein": 30}, max={"sodium": 800})
+    #   table.sort(ids, "protein", descending=True)
+    def __init__(self, rows: np.ndarray):
+        self.rows = rows
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @classmethod
+    def from_payloads(cls, payloads: Iterable[tuple[int, str]]) -> "NutritionTable":
+        records = []
+        for dish_id, payload in payloads:
+            nutrition = json.loads(payload)["nutrition"]
+            record = [dish_id, nutrition["servingSize"], nutrition["calories"]]
+            entries = [nutrition.get(name) for name in NUTRIENTS]
+            record += [entry["amt"] if entry else np.nan for entry in entries]
+            record += [entry["pdv"] if entry else -1 for entry in entries]
+            records.append(tuple(record))
+        rows = np.array(records, dtype=DTYPE)
+        rows.sort(order="id")
+        return cls(rows)
+
+    @classmethod
+    def from_store(cls, store: DishStore) -> "NutritionTable":
+        return cls.from_payloads(store.items())
+
+    def save(self, path: str = NUTRITION_FILE):
+        # np.save() adds .npy to any other suffix
+        tmp_path = tmp_path_for(path) + ".npy"
+        np.save(tmp_path, self.rows)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = NUTRITION_FILE, mmap: bool = True) -> "NutritionTable":
+        # Memory-mapped by default, only the columns a query touches get paged in
+        return cls(np.load(path, mmap_mode="r" if mmap else None))
+
+    def index(self, ids: Iterable[int]) -> np.ndarray:
+        # Row positions of the given dish ids, ids that aren't in the table are dropped
+        ids = np.asarray(ids if isinstance(ids, np.ndarray) else list(ids), dtype="<i8")
+        if len(self.rows) == 0:
+            return np.zeros(0, dtype=np.intp)
+        pos = np.minimum(np.searchsorted(self.rows["id"], ids), len(self.rows) - 1)
+        return pos[self.rows["id"][pos] == ids]
+
+    def select(self, ids: Optional[Iterable[int]] = None, min: Optional[dict[str, float]] = None,
+               max: Optional[dict[str, float]] = None) -> np.ndarray:
+        # Dish ids (of ids, or of the whole table) with min <= column <= max for every
+        # given column. NaN (missing) never matches a bound.
+        pos = np.arange(len(self.rows)) if ids is None else self.index(ids)
+        mask = np.ones(len(pos), dtype=bool)
+        for column, bound in (min or {}).items():
+            mask &= self.rows[column][pos] >= bound
+        for column, bound in (max or {}).items():
+            mask &= self.rows[column][pos] <= bound
+        return self.rows["id"][pos[mask]]
+
+    def sort(self, ids: Iterable[int], by: str, descending: bool = False) -> np.ndarray:
+        pos = self.index(ids)
+        values = self.rows[by][pos]
+        # Stable, so ties keep their id order either way
+        order = np.argsort(-values if descending else values, kind="stable")
+        return self.rows["id"][pos[order]]
+
+    def column(self, ids: Iterable[int], column: str) -> np.ndarray:
+        return self.rows[column][self.index(ids)]
+
+    def totals(self, groups: dict[Hashable, Iterable[int]], columns: Iterable[str]) -> dict[Hashable, dict[str, float]]:
+        # Per-group sums of each column (missing values count as 0), computed for all
+        # groups at once with one bincount per column
+        keys = list(groups)
+        positions = [self.index(groups[key]) for key in keys]
+        pos = np.concatenate(positions) if positions else np.zeros(0, dtype=np.intp)
+        labels = np.repeat(np.arange(len(keys)), [len(p) for p in positions])
+        sums = {}
+        for column in columns:
+            values = np.nan_to_num(self.rows[column][pos].astype("<f8"), nan=0.0)
+            sums[column] = np.bincount(labels, weights=values, minlength=len(keys))
+        return {key: {column: float(sums[column][i]) for column in sums} for i, key in enumerate(keys)}
+
+
+def menu_groups(locations: Iterable[MunchLocation], by: str = "period") -> dict[tuple, list[int]]:
+    # Dish ids per (location id, "y-m-d", period) or, with by="station",
+    # per (location id, "y-m-d", period, station)
+    groups: dict[tuple, list[int]] = {}
+    for location in locations:
+        for location_date in location.dates:
+            date = f"{location_date.date.y}-{location_date.date.m}-{location_date.date.d}"
+            for period in location_date.periods:
+                for station in period.stations:
+                    key = (location.id, date, period.name) + ((station.name,) if by == "station" else ())
+                    groups.setdefault(key, []).extend(station.dishes)
+    return groups
+
+
+def menu_ids(locations: Iterable[MunchLocation], location: Optional[int] = None, date: Optional[str] = None,
+             period: Optional[str] = None) -> list[int]:
+    # Unique dish ids on the matching menus, in first-seen order
+    ids = {}
+    for (location_id, menu_date, menu_period), dish_ids in menu_groups(locations).items():
+        if location not in (None, location_id) or date not in (None, menu_date) or period not in (None, menu_period):
+            continue
+        ids.update(dict.fromkeys(dish_ids))
+    return list(ids)
+
+
+def load_locations(path: str = THEHILL_FILE) -> list[MunchLocation]:
+    with open(path, "r") as f:
+        # Our own output, no need to validate it again
+        return [construct(MunchLocation, location) for location in json.load(f)]
+
+
+def build(store: DishStore, path: str = NUTRITION_FILE) -> NutritionTable:
+    table = NutritionTable.from_store(store)
+    table.save(path)
+    logging.info(f"Wrote nutrition for {len(table)} dishes to {path}")
+    return table
+
+
+def parse_bounds(values: list[str]) -> dict[str, float]:
+    bounds = {}
+    for value in values:
+        column, bound = value.split("=", 1)
+        bounds[column] = float(bound)
+    return bounds
+
+
+def main():
+    # python -m src.nutrition build
+    # python -m src.nutrition query --location 866 --period Dinner --min protein=30 --max sodium=800
+    parser = argparse.ArgumentParser(prog="python -m src.nutrition")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("build", help="rebuild data/nutrition.npy from the dish store")
+    query = sub.add_parser("query", help="filter the dishes on data/thehill.json's menus by nutrient")
+    query.add_argument("--location", type=int)
+    query.add_argument("--date", help="y-m-d, no zero padding")
+    query.add_argument("--period")
+    query.add_argument("--min", action="append", default=[], metavar="COLUMN=VALUE")
+    query.add_argument("--max", action="append", default=[], metavar="COLUMN=VALUE")
+    query.add_argument("--sort", metavar="COLUMN")
+    query.add_argument("--desc", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+        store = open_store()
+        build(store)
+        store.close()
+        return
+
+    table = NutritionTable.load()
+    locations = load_locations()
+    ids = table.select(menu_ids(locations, args.location, args.date, args.period),
+                       min=parse_bounds(args.min), max=parse_bounds(args.max))
+    if args.sort:
+        ids = table.sort(ids, args.sort, args.desc)
+    columns = ["calories", "protein", "sodium"] + [c for c in (args.sort,) if c and c not in ("calories", "protein", "sodium")]
+    for dish_id, row in zip(ids, table.rows[table.index(ids)]):
+        print(dish_id, " ".join(f"{column}={row[column]:g}" for column in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import filecmp
+import json
+import os
+from typing import Iterable, Optional
+
+from pydantic import BaseModel
+
+
+def tmp_path_for(path: str) -> str:
+    # Per process, so two runs writing the same file (the daemon and a CLI run) don't
+    # share a temp file
+    return f"{path}.{os.getpid()}.tmp"
+
+
+def write_atomic(path: str, data: str | bytes):
+    # Readers (and a crashed run's successor) see the old file or the new one, never half of one
+    tmp_path = tmp_path_for(path)
+    try:
+        with open(tmp_path, "wb" if isinstance(data, bytes) else "w") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def dumps(model: BaseModel) -> str:
+    # Same bytes as json.dumps(json.loads(model.model_dump_json())), without the
+    # intermediate JSON string and its parsed copy
+    return json.dumps(model.model_dump(mode="json"))
+
+
+class JsonArrayWriter:
+    # Writes a JSON array one element at a time to <path>.<pid>.tmp and renames it over
+    # <path> on a clean exit, so readers never see a half-written file. The result is
+    # byte-identical to json.dumps() of the whole list.
+    #
+    #   with JsonArrayWriter(OUT_FILE) as out:
+    #       for location in locations:
+    #           out.write(location)
+    def __init__(self, path: str, skip_if_unchanged: bool = False):
+        self.path = path
+        self.tmp_path = tmp_path_for(path)
+        # Leave the existing file (and its mtime) alone when the new bytes are the same
+        self.skip_if_unchanged = skip_if_unchanged
+        self.count = 0
+        self.changed: Optional[bool] = None
+        self._f = None
+
+    def __enter__(self) -> "JsonArrayWriter":
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._f = open(self.tmp_path, "w")
+        self._f.write("[")
+        return self
+
+    def write_raw(self, j: str):
+        # j must already be serialized the way json.dumps() would
+        if self.count:
+            self._f.write(", ")
+        self._f.write(j)
+        self.count += 1
+
+    def write(self, item: BaseModel):
+        self.write_raw(dumps(item))
+
+    def write_all(self, items: Iterable[BaseModel]):
+        for item in items:
+            self.write(item)
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            # Keep the previous output rather than publishing a partial one
+            self._f.close()
+            os.remove(self.tmp_path)
+            return False
+        self._f.write("]")
+        self._f.close()
+        if self.skip_if_unchanged and os.path.exists(self.path) and filecmp.cmp(self.tmp_path, self.path, shallow=False):
+            os.remove(self.tmp_path)
+            self.changed = False
+        else:
+            os.replace(self.tmp_path, self.path)
+            self.changed = True
+        return False
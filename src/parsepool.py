@@ -0,0 +1,47 @@
+import logging
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Optional
+
+# Worker processes for CPU-bound page parsing, 1 parses inline on the main thread
+DEFAULT_WORKERS = 1
+
+
+class ParsePool:
+    # Parses handed off ahead of time, keyed by URL. Callers take() the future for a
+    # page at the point they would have parsed it inline, so results are consumed in
+    # document order whatever order the workers finish in.
+    def __init__(self, workers: int = DEFAULT_WORKERS):
+        self.workers = max(1, workers)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending: dict[str, Future] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 1
+
+    def submit(self, key: str, fn: Callable, *args):
+        if key in self._pending:
+            return
+        if self._executor is None:
+            logging.info(f"Starting {self.workers} parse workers")
+            self._executor = ProcessPoolExecutor(self.workers)
+        self._pending[key] = self._executor.submit(fn, *args)
+
+    def take(self, key: str) -> Optional[Future]:
+        return self._pending.pop(key, None)
+
+    def clear(self):
+        # Anything submitted but never taken (e.g. after an error) is dropped, the
+        # workers are kept for the next run
+        self._pending.clear()
+
+    def close(self):
+        self.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+def workers_from_env() -> int:
+    return int(os.environ.get("MUNCH_PARSE_WORKERS", DEFAULT_WORKERS))
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+import importlib.util
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+# lxml is several times faster than the pure-Python html.parser, fall back if it isn't installed
+DEFAULT_BACKEND = "lxml" if importlib.util.find_spec("lxml") else "html.parser"
+HTML_PARSER = os.environ.get("MUNCH_HTML_PARSER", DEFAULT_BACKEND)
+# Set MUNCH_HTML_STRAIN=0 to always build the full document tree
+STRAIN = os.environ.get("MUNCH_HTML_STRAIN", "1") != "0"
+
+
+class SubtreeStrainer(SoupStrainer):
+    # Keeps the whole subtree of every tag matching any of the given simple selectors
+    # (tag, tag#id, tag.class, tag[attr=value]). SoupStrainer's own rules are ANDed
+    # together and see "class" as the raw attribute string, hence the subclass.
+    SELECTOR = re.compile(r"^([\w-]+)?(?:#([\w-]+))?(?:\.([\w-]+))?(?:\[([\w-]+)=\"?([^\"\]]+)\"?])?$")
+
+    def __init__(self, *selectors: str):
+        super().__init__()
+        self.selectors = selectors
+        self.rules = [self.SELECTOR.match(selector).groups() for selector in selectors]
+
+    def allow_tag_creation(self, nsprefix, name, attrs) -> bool:
+        attrs = attrs or {}
+        classes = attrs.get("class", "")
+        if isinstance(classes, str):
+            classes = classes.split()
+        for tag, tag_id, tag_class, attr, value in self.rules:
+            if tag and tag != name:
+                continue
+            if tag_id and attrs.get("id") != tag_id:
+                continue
+            if tag_class and tag_class not in classes:
+                continue
+            if attr and attrs.get(attr) != value:
+                continue
+            return True
+        return False
+
+    def allow_string_creation(self, string: str) -> bool:
+        return False
+
+
+# Only the parts of each page type the scraper actually reads. Date pages are not
+# strained: meal periods are found by walking from the "#...menu.anchor-float" marker
+# to its next sibling, which only exists in the full tree.
+PAGE_STRAINERS = {
+    "location": SubtreeStrainer("div.dining-hours-summary", "select"),
+    "date": None,
+    "dish": SubtreeStrainer("div#ingredient_list", "div#nutrition", "div.single-complex-grid"),
+    "article": SubtreeStrainer("div[itemprop=articleBody]"),
+}
+
+
+def make_soup(html: str, page_type: str | None = None, parser: str | None = None,
+              strain: bool | None = None) -> BeautifulSoup:
+    strainer = PAGE_STRAINERS.get(page_type) if (STRAIN if strain is None else strain) else None
+    return BeautifulSoup(html, parser or HTML_PARSER, parse_only=strainer)
+
+
+def measure(html: str, page_type: str, parser: str, strain: bool, rounds: int = 5) -> tuple[float, int]:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        make_soup(html, page_type, parser, strain)
+    elapsed = (time.perf_counter() - start) / rounds
+    tracemalloc.start()
+    soup = make_soup(html, page_type, parser, strain)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del soup
+    return elapsed, peak
+
+
+def main():
+    # python -m src.parsing date=page.html dish=recipe.html ...
+    print(f"{'page type':<10} {'html.parser ms':>15} {HTML_PARSER + ' ms':>15} {'speedup':>8} "
+          f"{'html.parser KiB':>16} {HTML_PARSER + ' KiB':>16} {'saved':>6}")
+    for arg in sys.argv[1:]:
+        page_type, path = arg.split("=", 1)
+        with open(path, "r", encoding="utf-8") as f:
+            html = f.read()
+        base_t, base_m = measure(html, page_type, "html.parser", False)
+        fast_t, fast_m = measure(html, page_type, HTML_PARSER, STRAIN)
+        print(f"{page_type:<10} {base_t * 1000:>15.2f} {fast_t * 1000:>15.2f} {base_t / fast_t:>7.1f}x "
+              f"{base_m / 1024:>16.0f} {fast_m / 1024:>16.0f} {1 - fast_m / base_m:>6.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import json
+import os
+import time
+from datetime import date, timedelta
+from typing import Collection, List, NamedTuple, Optional
+
+from src.models import *
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+EXCEPTIONS_FILE = os.path.join(DATA_DIR, "exceptions.json")
+
+# Dates this many days out or fewer (today, tomorrow) are fetched on every run
+ALWAYS_FETCH_DAYS = 1
+# Later dates reuse their last result while it's younger than FAR_REFRESH_HOURS per day
+# past tomorrow (12h for the day after tomorrow, 24h for the day after that, ...),
+# but never older than MAX_FAR_REFRESH_HOURS
+FAR_REFRESH_HOURS = float(os.environ.get("MUNCH_FAR_REFRESH_HOURS", "12"))
+MAX_FAR_REFRESH_HOURS = 72
+# periods value of an exception covering breakfast, lunch and dinner (1 + 3 + 5)
+ALL_PERIODS = 9
+
+
+class WorkItem(NamedTuple):
+    location_id: int
+    date: MunchDate
+    url: str
+    # "fetch" the page, "reuse" the last result, "resume" (already parsed by an interrupted
+    # run) or "closed" (no page needed)
+    action: str
+
+    @property
+    def key(self) -> str:
+        return f"{self.location_id}/{self.date.y}-{self.date.m}-{self.date.d}"
+
+
+def to_date(d: MunchDate) -> date:
+    return date(d.y, d.m, d.d)
+
+
+def load_exceptions(path: str = EXCEPTIONS_FILE) -> dict[int, List[MunchDiningHallException]]:
+    # hall id -> exceptions, as written by src/exceptions.py
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        data = json.load(f)
+    return {
+        int(hall_id): [MunchDiningHallException.model_validate(e) for e in exceptions]
+        for hall_id, exceptions in data.items()
+    }
+
+
+def is_closed(exceptions: List[MunchDiningHallException], day: date) -> bool:
+    # Only closures covering every meal period; a partial closure still has a menu page
+    for e in exceptions:
+        if e.status != 0 or e.periods != ALL_PERIODS:
+            continue
+        if e.specifics and any(to_date(d) == day for d in e.specifics):
+            return True
+        if e.startDate and to_date(e.startDate) <= day and (e.endDate is None or day <= to_date(e.endDate)):
+            return True
+    return False
+
+
+def hall_closed(exceptions: List[MunchDiningHallException], today: date) -> bool:
+    # Closed for every date that's always fetched, e.g. when its page has no hours or dates to go on
+    return all(is_closed(exceptions, today + timedelta(days=n)) for n in range(ALWAYS_FETCH_DAYS + 1))
+
+
+def refresh_seconds(days_out: int) -> float:
+    hours = min(MAX_FAR_REFRESH_HOURS, FAR_REFRESH_HOURS * (days_out - ALWAYS_FETCH_DAYS))
+    return hours * 60 * 60
+
+
+def plan_location(location_id: int, loc_url: str, dates: List[MunchDate], today: date,
+                  exceptions: List[MunchDiningHallException], fingerprints: dict[str, dict],
+                  done: Collection[str] = (), now: Optional[float] = None) -> List[WorkItem]:
+    # One work item per date from today on, in the order the page lists them
+    now = time.time() if now is None else now
+    items = []
+    for d in dates:
+        day = to_date(d)
+        if day < today:
+            continue
+        url = loc_url + f"?date={d.y}-{d.m}-{d.d}"
+        item = WorkItem(location_id, d, url, "fetch")
+        days_out = (day - today).days
+        if is_closed(exceptions, day):
+            item = item._replace(action="closed")
+        elif item.key in done:
+            item = item._replace(action="resume")
+        elif days_out > ALWAYS_FETCH_DAYS:
+            entry = fingerprints.get(item.key)
+            if entry and now - entry.get("at", 0) < refresh_seconds(days_out):
+                item = item._replace(action="reuse")
+        items.append(item)
+    return items
+
+
+def closed_items(location_id: int, today: date) -> List[WorkItem]:
+    # Stand-ins for the dates a closed hall's page would have listed, when it lists none
+    days = [today + timedelta(days=n) for n in range(ALWAYS_FETCH_DAYS + 1)]
+    return [WorkItem(location_id, MunchDate(y=day.year, m=day.month, d=day.day), "", "closed") for day in days]
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+import glob
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+
+import brotli
+
+from src.output import write_atomic
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+DIST_DIR = os.path.join(DATA_DIR, "dist")
+MANIFEST_NAME = "manifest.json"
+# MUNCH_PUBLISH=0 to skip the publish stage after a scrape
+PUBLISH_ENABLED = os.environ.get("MUNCH_PUBLISH", "1") != "0"
+# Hashed files dropped from the manifest are kept this long, for clients still on an older manifest
+KEEP_HOURS = float(os.environ.get("MUNCH_PUBLISH_KEEP_HOURS", "24"))
+
+# Logical names (relative to data/) of everything clients download
+ARTIFACTS = [
+    "thehill.json",
+    "thehill/*/*.json",
+    "mealclusters/*.json",
+    "meals/*.json",
+    "exceptions.json",
+    "mealswipes-*.json",
+]
+# Hex digits of the sha256 kept in file names
+HASH_LENGTH = 16
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+
+def artifact_names(data_dir: str = DATA_DIR) -> list[str]:
+    names = []
+    for pattern in ARTIFACTS:
+        for path in glob.glob(os.path.join(data_dir, pattern)):
+            name = os.path.relpath(path, data_dir).replace(os.sep, "/")
+            # Internal state (_cache.json) and the shard manifest aren't published
+            if os.path.basename(name).startswith("_") or name.endswith("/" + MANIFEST_NAME):
+                continue
+            names.append(name)
+    return sorted(names)
+
+
+def hashed_name(name: str, digest: str) -> str:
+    # "meals/12345.json" -> "meals/12345.<hash>.json"
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{digest[:HASH_LENGTH]}{ext}"
+
+
+class Publisher:
+    # Copies every artifact into data/dist/ under a content-hashed name, plus .gz and
+    # .br variants, and writes data/dist/manifest.json:
+    #   {"files": {"meals/12345.json": {"path": "meals/12345.<hash>.json", "hash": <sha256>,
+    #     "bytes": n, "gzip": {"path": ..., "bytes": n}, "br": {"path": ..., "bytes": n}}},
+    #    "retired": {"meals/12345.<old hash>.json": <unix time it left "files">, ...}}
+    # Hashed files never change, so clients can cache them forever and only need a fresh
+    # manifest. Unchanged artifacts keep their entry; nothing is compressed twice. A file
+    # that drops out of "files" stays for KEEP_HOURS, so a client that fetched the previous
+    # manifest doesn't get 404s, and is deleted after that.
+    def __init__(self, data_dir: str = DATA_DIR, dist_dir: str = DIST_DIR):
+        self.data_dir = data_dir
+        self.dist_dir = dist_dir
+        self.manifest_path = os.path.join(dist_dir, MANIFEST_NAME)
+        self.files: dict[str, dict] = {}
+        self.retired: dict[str, int] = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r") as f:
+                manifest = json.load(f)
+            self.files = manifest["files"]
+            self.retired = manifest.get("retired", {})
+        self.written: list[str] = []
+        self.removed: list[str] = []
+
+    def publish_one(self, name: str) -> dict:
+        with open(os.path.join(self.data_dir, name), "rb") as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        entry = self.files.get(name)
+        if entry and entry["hash"] == digest and all(
+                os.path.exists(os.path.join(self.dist_dir, path))
+                for path in (entry["path"], entry["gzip"]["path"], entry["br"]["path"])):
+            return entry
+
+        path = hashed_name(name, digest)
+        variants = {
+            path: data,
+            path + ".gz": gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0),
+            path + ".br": brotli.compress(data, quality=BROTLI_QUALITY),
+        }
+        for variant, content in variants.items():
+            variant_path = os.path.join(self.dist_dir, variant)
+            os.makedirs(os.path.dirname(variant_path), exist_ok=True)
+            write_atomic(variant_path, content)
+        self.written.append(name)
+        return {
+            "path": path,
+            "hash": digest,
+            "bytes": len(data),
+            "gzip": {"path": path + ".gz", "bytes": len(variants[path + ".gz"])},
+            "br": {"path": path + ".br", "bytes": len(variants[path + ".br"])},
+        }
+
+    def publish(self) -> dict[str, dict]:
+        files = {name: self.publish_one(name) for name in artifact_names(self.data_dir)}
+        self.removed = [name for name in self.files if name not in files]
+        retired = self.retired
+        changed = files != self.files or not os.path.exists(self.manifest_path)
+        self.files = files
+        expired = self.retire(int(time.time()))
+        if changed or self.retired != retired:
+            os.makedirs(self.dist_dir, exist_ok=True)
+            write_atomic(self.manifest_path, json.dumps({"files": files, "retired": self.retired}, indent=2) + "\n")
+        for path in expired:
+            os.remove(os.path.join(self.dist_dir, path))
+        return files
+
+    def retire(self, now: int) -> list[str]:
+        # Hashed files no longer in the manifest are retired; returns those retired for
+        # longer than KEEP_HOURS, to be deleted
+        keep = {MANIFEST_NAME}
+        for entry in self.files.values():
+            keep.update((entry["path"], entry["gzip"]["path"], entry["br"]["path"]))
+        retired = {}
+        expired = []
+        for root, _, names in os.walk(self.dist_dir):
+            for name in names:
+                path = os.path.relpath(os.path.join(root, name), self.dist_dir).replace(os.sep, "/")
+                if path in keep:
+                    continue
+                since = self.retired.get(path, now)
+                if now - since >= KEEP_HOURS * 60 * 60:
+                    expired.append(path)
+                else:
+                    retired[path] = since
+        self.retired = dict(sorted(retired.items()))
+        return expired
+
+
+def publish(data_dir: str = DATA_DIR, dist_dir: str = DIST_DIR) -> Publisher:
+    publisher = Publisher(data_dir, dist_dir)
+    files = publisher.publish()
+    raw = sum(entry["bytes"] for entry in files.values())
+    br = sum(entry["br"]["bytes"] for entry in files.values())
+    logging.info(f"Published {len(files)} artifacts ({len(publisher.written)} new, {len(publisher.removed)} "
+                 f"removed), {raw} bytes raw, {br} bytes brotli")
+    return publisher
+
+
+def main():
+    # python -m src.publish, re-publishes data/ without scraping
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    publish()
+
+
+if __name__ == "__main__":
+    main()
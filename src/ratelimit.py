@@ -0,0 +1,94 @@
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
+from urllib.parse import urlsplit
+
+# Sustained requests per second per host, and how many may go out back to back
+DEFAULT_RATE = float(os.environ.get("MUNCH_RATE", "4"))
+DEFAULT_BURST = int(os.environ.get("MUNCH_BURST", "4"))
+# Exponential backoff between retries is capped here (seconds), and so is Retry-After
+BACKOFF_CAP = 60.0
+RETRY_AFTER_CAP = 300.0
+
+
+class TokenBucket:
+    # Thread-safe. reserve() takes a token right away and returns how long the caller
+    # must wait before using it, so waiting happens outside the lock and callers are
+    # served in the order they reserved.
+    def __init__(self, rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        # Nothing goes out before this (set from Retry-After)
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(delay, self.paused_until - now)
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            # The server asked for a break, don't follow it with a full burst
+            self.tokens = min(self.tokens, 1.0)
+
+
+class RateLimiter:
+    # One bucket per host, shared by every caller: sync fetches and the concurrent
+    # fetcher's threads (src/fetcher.py runs fetch() via asyncio.to_thread) alike
+    def __init__(self, rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._buckets: dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, url: str) -> TokenBucket:
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(self.rate, self.burst)
+            return self._buckets[host]
+
+    def acquire(self, url: str) -> float:
+        # Blocks until a request to url's host may go out, returns the time waited
+        delay = self.bucket(url).reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def retry_after(self, url: str, seconds: float):
+        self.bucket(url).pause(seconds)
+
+
+LIMITER = RateLimiter()
+
+
+def retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    # Retry-After is either delay-seconds or an HTTP-date
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        seconds = float(value)
+    else:
+        try:
+            seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), RETRY_AFTER_CAP)
+
+
+def backoff_delay(attempt: int, base: float) -> float:
+    # "Full jitter": uniform in [0, base * 2^(attempt - 1)], capped
+    return random.uniform(0, min(BACKOFF_CAP, base * 2 ** (attempt - 1)))
@@ -0,0 +1,95 @@
+import logging
+import os
+import time
+from typing import Iterable, Optional
+
+from src.store import DishStore
+
+# Per-dish refetch interval. New dishes start at DEFAULT_TTL; every refetch that finds
+# the same payload stretches it by TTL_GROWTH, every real change cuts it by TTL_SHRINK.
+MIN_TTL = 60*60*24*3
+DEFAULT_TTL = 60*60*24*15
+MAX_TTL = 60*60*24*60
+TTL_GROWTH = 1.5
+TTL_SHRINK = 0.5
+# Due times are spread +-JITTER around the TTL (fixed per dish), so dishes first
+# fetched in the same run don't all come due in the same later run
+JITTER = 0.1
+
+# Max refetches of already-stored dishes per run, 0 = no limit. Dishes never fetched
+# before are always fetched and don't count against it.
+DEFAULT_BUDGET = 0
+
+
+def budget_from_env() -> int:
+    return int(os.environ.get("MUNCH_REFRESH_BUDGET", DEFAULT_BUDGET))
+
+
+def jitter(dish_id: int) -> float:
+    # Deterministic per dish, in [1 - JITTER, 1 + JITTER)
+    return 1 - JITTER + 2 * JITTER * ((dish_id * 2654435761) % 1000) / 1000
+
+
+class RefreshScheduler:
+    # Decides which stored dishes get refetched this run. A dish is due once it's older
+    # than its own (jittered) TTL; with a budget, only the plan()ned due dishes are
+    # refetched and the rest are served from the store until a later run.
+    def __init__(self, store: DishStore, budget: int = DEFAULT_BUDGET, exclude: Iterable[int] = (),
+                 now: Optional[int] = None):
+        self.store = store
+        self.budget = budget
+        # Always refetched (MEAL_EXCLUSION_LIST)
+        self.exclude = set(exclude)
+        self.now = int(time.time()) if now is None else now
+        # None = every due dish may be refetched
+        self.allowed: Optional[set[int]] = None
+
+    def overdue(self, dish_id: int, fetched_at: int, ttl: Optional[int]) -> float:
+        # How far past its TTL a dish is, as a fraction of the TTL (>= 0 means due)
+        ttl = (ttl or DEFAULT_TTL) * jitter(dish_id)
+        return (abs(self.now - fetched_at) - ttl) / ttl
+
+    def plan(self, priority: Iterable[int] = ()) -> Optional[set[int]]:
+        # Picks the due dishes to refetch within the budget: dishes in priority (on
+        # today's menus) first, then the most overdue relative to their TTL
+        if self.budget <= 0:
+            return None
+        priority = set(priority)
+        due = []
+        for dish_id, fetched_at, ttl in self.store.refresh_states():
+            if dish_id in self.exclude:
+                continue
+            overdue = self.overdue(dish_id, fetched_at, ttl)
+            if overdue >= 0:
+                due.append((dish_id not in priority, -overdue, dish_id))
+        due.sort()
+        self.allowed = {dish_id for _, _, dish_id in due[:self.budget]}
+        logging.info(f"{len(due)} dishes due for a refresh, {len(self.allowed)} scheduled this run")
+        return self.allowed
+
+    def state(self, dish_id: int) -> str:
+        # "hit", "miss" (never fetched), "expired" (due, refetch now), "deferred" (due,
+        # but over this run's budget) or "excluded"
+        row = self.store.refresh_state(dish_id)
+        if row is None:
+            return "miss"
+        if dish_id in self.exclude:
+            return "excluded"
+        fetched_at, ttl, _ = row
+        if self.overdue(dish_id, fetched_at, ttl) < 0:
+            return "hit"
+        if self.allowed is not None and dish_id not in self.allowed:
+            return "deferred"
+        return "expired"
+
+    def record(self, dish_id: int, changed: bool, new: bool):
+        # Called after every fetch with whether the stored payload actually changed
+        if new:
+            self.store.set_refresh(dish_id, DEFAULT_TTL, 0)
+            return
+        _, ttl, unchanged = self.store.refresh_state(dish_id)
+        ttl = ttl or DEFAULT_TTL
+        if changed:
+            self.store.set_refresh(dish_id, max(MIN_TTL, int(ttl * TTL_SHRINK)), 0)
+        else:
+            self.store.set_refresh(dish_id, min(MAX_TTL, int(ttl * TTL_GROWTH)), unchanged + 1)
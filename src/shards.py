@@ -0,0 +1,67 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from src.models import *
+from src.output import dumps, write_atomic
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+SHARDS_DIR = os.path.join(DATA_DIR, "thehill")
+MANIFEST_NAME = "manifest.json"
+# MUNCH_SHARDS=0 to only write the monolithic data/thehill.json
+SHARDS_ENABLED = os.environ.get("MUNCH_SHARDS", "1") != "0"
+
+
+def shard_key(location_id: int, date: MunchDate) -> str:
+    return f"{location_id}/{date.y:04d}-{date.m:02d}-{date.d:02d}"
+
+
+class ShardWriter:
+    # data/thehill/<location id>/<YYYY-MM-DD>.json holds one location with just that
+    # date, data/thehill/manifest.json maps "<location id>/<YYYY-MM-DD>" to
+    # {"path", "hash" (sha256 of the shard), "bytes", "modified"}. A shard is only
+    # rewritten (and its "modified" bumped) when its hash changes, so clients can
+    # compare manifests and fetch just the shards that did.
+    def __init__(self, root: str = SHARDS_DIR, now: Optional[datetime] = None):
+        self.root = root
+        self.manifest_path = os.path.join(root, MANIFEST_NAME)
+        self.modified = (now or datetime.now(timezone.utc)).isoformat(timespec="seconds")
+        self.shards: dict[str, dict] = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r") as f:
+                self.shards = json.load(f)["shards"]
+        self.written: List[str] = []
+        self.removed: List[str] = []
+
+    def write(self, location: MunchLocation):
+        # Replaces every shard of this location; dates it no longer lists are dropped
+        keys = set()
+        for location_date in location.dates:
+            key = shard_key(location.id, location_date.date)
+            keys.add(key)
+            data = dumps(location.model_copy(update={"dates": [location_date]})).encode()
+            digest = hashlib.sha256(data).hexdigest()
+            path = os.path.join(self.root, key + ".json")
+            entry = self.shards.get(key)
+            if entry and entry["hash"] == digest and os.path.exists(path):
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            write_atomic(path, data)
+            self.shards[key] = {"path": key + ".json", "hash": digest, "bytes": len(data),
+                                "modified": self.modified}
+            self.written.append(key)
+
+        prefix = f"{location.id}/"
+        for key in [key for key in self.shards if key.startswith(prefix) and key not in keys]:
+            path = os.path.join(self.root, self.shards.pop(key)["path"])
+            if os.path.exists(path):
+                os.remove(path)
+            self.removed.append(key)
+
+    def close(self):
+        if not self.written and not self.removed and os.path.exists(self.manifest_path):
+            return
+        os.makedirs(self.root, exist_ok=True)
+        write_atomic(self.manifest_path, json.dumps({"shards": dict(sorted(self.shards.items()))}, indent=2) + "\n")
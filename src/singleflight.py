@@ -0,0 +1,90 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+# Completed pages kept for the rest of the run so a repeat request doesn't go to the
+# network again, oldest dropped first past this many characters
+DEFAULT_MEMO_CHARS = int(os.environ.get("MUNCH_FETCH_MEMO_MB", "64")) * 1024 * 1024
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    # The first caller for a key runs fn, concurrent callers for the same key wait for
+    # it and get the same result (or exception). Successful results are also kept
+    # (up to memo_chars) until clear(), so later callers in the same run share them.
+    def __init__(self, memo_chars: int = DEFAULT_MEMO_CHARS):
+        self.memo_chars = memo_chars
+        self._lock = threading.Lock()
+        self._calls: dict[str, _Call] = {}
+        self._memo: OrderedDict[str, str] = OrderedDict()
+        self._memo_size = 0
+        self.requested: dict[str, int] = {}
+        self.coalesced = 0
+        self.memo_hits = 0
+
+    def do(self, key: str, fn: Callable[[], str]) -> str:
+        with self._lock:
+            self.requested[key] = self.requested.get(key, 0) + 1
+            if key in self._memo:
+                self.memo_hits += 1
+                self._memo.move_to_end(key)
+                return self._memo[key]
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                if call.error is None:
+                    self._remember(key, call.result)
+            call.done.set()
+        return call.result
+
+    def _remember(self, key: str, result: str):
+        if len(result) > self.memo_chars:
+            return
+        self._memo[key] = result
+        self._memo_size += len(result)
+        while self._memo_size > self.memo_chars:
+            _, dropped = self._memo.popitem(last=False)
+            self._memo_size -= len(dropped)
+
+    def forget(self, key: str):
+        with self._lock:
+            dropped = self._memo.pop(key, None)
+            if dropped is not None:
+                self._memo_size -= len(dropped)
+
+    def duplicates(self) -> int:
+        # Requests that were served without a download of their own
+        return self.coalesced + self.memo_hits
+
+    def clear(self):
+        with self._lock:
+            self._memo.clear()
+            self._memo_size = 0
+            self.requested.clear()
+            self.coalesced = 0
+            self.memo_hits = 0
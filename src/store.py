@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+import glob
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+from typing import Iterable, Iterator, List, Optional
+
+from src.output import write_atomic
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+DB_FILE = os.path.join(DATA_DIR, "meals.db")
+MEAL_FILE_PREFIX = os.path.join(DATA_DIR, "meals")
+MEAL_CACHE_FILE = os.path.join(MEAL_FILE_PREFIX, "_cache.json")
+# id -> [ttl, unchanged] of dishes with scheduler state (src/schedule.py), so a store
+# rebuilt from data/meals/ keeps it
+MEAL_REFRESH_FILE = os.path.join(MEAL_FILE_PREFIX, "_refresh.json")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dishes (
+    id INTEGER PRIMARY KEY,
+    fetched_at INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    ttl INTEGER,
+    unchanged INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS dishes_fetched_at ON dishes (fetched_at);
+"""
+
+# Columns added after the first release of the store, added to older databases on open
+MIGRATIONS = {
+    "ttl": "ALTER TABLE dishes ADD COLUMN ttl INTEGER",
+    "unchanged": "ALTER TABLE dishes ADD COLUMN unchanged INTEGER NOT NULL DEFAULT 0",
+}
+
+# Keeps IN (...) lists under SQLite's host parameter limit
+CHUNK = 500
+
+
+def payload_hash(payload: str) -> str:
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class DishStore:
+    # One row per dish: the exact MunchDish JSON written to data/meals/<id>.json,
+    # when it was last fetched, and a hash of the payload to spot real changes
+    def __init__(self, path: str = DB_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(dishes)")}
+        for column, statement in MIGRATIONS.items():
+            if column not in columns:
+                self.conn.execute(statement)
+        self.conn.commit()
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM dishes").fetchone()[0]
+
+    def fetched_at(self, dish_id: int) -> Optional[int]:
+        row = self.conn.execute("SELECT fetched_at FROM dishes WHERE id = ?", (dish_id,)).fetchone()
+        return row[0] if row else None
+
+    def refresh_state(self, dish_id: int) -> Optional[tuple[int, Optional[int], int]]:
+        # (fetched_at, ttl or None for the default, unchanged refetches in a row)
+        return self.conn.execute("SELECT fetched_at, ttl, unchanged FROM dishes WHERE id = ?", (dish_id,)).fetchone()
+
+    def refresh_states(self) -> Iterator[tuple[int, int, Optional[int]]]:
+        # (id, fetched_at, ttl) of every dish
+        yield from self.conn.execute("SELECT id, fetched_at, ttl FROM dishes")
+
+    def set_refresh(self, dish_id: int, ttl: int, unchanged: int):
+        self.conn.execute("UPDATE dishes SET ttl = ?, unchanged = ? WHERE id = ?", (ttl, unchanged, dish_id))
+        self.conn.commit()
+
+    def get(self, dish_id: int) -> Optional[str]:
+        row = self.conn.execute("SELECT payload FROM dishes WHERE id = ?", (dish_id,)).fetchone()
+        return row[0] if row else None
+
+    def get_many(self, dish_ids: Iterable[int]) -> dict[int, str]:
+        dish_ids = list(dish_ids)
+        payloads = {}
+        for i in range(0, len(dish_ids), CHUNK):
+            chunk = dish_ids[i:i + CHUNK]
+            rows = self.conn.execute(
+                    f"SELECT id, payload FROM dishes WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+            payloads.update(rows)
+        return payloads
+
+    def items(self) -> Iterator[tuple[int, str]]:
+        # Every (id, payload), in id order
+        yield from self.conn.execute("SELECT id, payload FROM dishes ORDER BY id")
+
+    def expired(self, before: int) -> List[int]:
+        return [row[0] for row in self.conn.execute("SELECT id FROM dishes WHERE fetched_at < ?", (before,))]
+
+    def put(self, dish_id: int, payload: str, fetched_at: int) -> bool:
+        # Returns whether the payload actually changed
+        new_hash = payload_hash(payload)
+        row = self.conn.execute("SELECT hash FROM dishes WHERE id = ?", (dish_id,)).fetchone()
+        self.conn.execute(
+                "INSERT INTO dishes (id, fetched_at, hash, payload) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET fetched_at = excluded.fetched_at, hash = excluded.hash, "
+                "payload = excluded.payload",
+                (dish_id, fetched_at, new_hash, payload))
+        self.conn.commit()
+        return row is None or row[0] != new_hash
+
+    def import_legacy(self, meals_dir: str = MEAL_FILE_PREFIX, cache_file: str = MEAL_CACHE_FILE,
+                      refresh_file: str = MEAL_REFRESH_FILE) -> int:
+        # Rebuilds the store from data/meals/<id>.json + _cache.json + _refresh.json, which
+        # is all that's committed (meals.db isn't)
+        cache = {}
+        if os.path.exists(cache_file):
+            with open(cache_file, "r") as f:
+                cache = json.load(f)
+        refresh = {}
+        if os.path.exists(refresh_file):
+            with open(refresh_file, "r") as f:
+                refresh = json.load(f)
+        rows = []
+        for path in glob.glob(os.path.join(meals_dir, "*.json")):
+            name = os.path.basename(path)[:-len(".json")]
+            if not name.isdigit():
+                continue
+            with open(path, "r") as f:
+                payload = f.read()
+            ttl, unchanged = refresh.get(name, (None, 0))
+            rows.append((int(name), cache.get(name) or 0, payload_hash(payload), payload, ttl, unchanged))
+        self.conn.executemany("INSERT OR REPLACE INTO dishes (id, fetched_at, hash, payload, ttl, unchanged) "
+                              "VALUES (?, ?, ?, ?, ?, ?)", rows)
+        self.conn.commit()
+        return len(rows)
+
+    def export(self, meals_dir: str = MEAL_FILE_PREFIX, dish_ids: Optional[Iterable[int]] = None):
+        # Clients still read the per-dish files, plus _cache.json for the fetch times
+        os.makedirs(meals_dir, exist_ok=True)
+        if dish_ids is None:
+            payloads = dict(self.conn.execute("SELECT id, payload FROM dishes"))
+        else:
+            payloads = self.get_many(set(dish_ids))
+        for dish_id, payload in payloads.items():
+            write_atomic(os.path.join(meals_dir, f"{dish_id}.json"), payload)
+        write_atomic(os.path.join(meals_dir, "_cache.json"), json.dumps({
+            str(dish_id): fetched_at
+            for dish_id, fetched_at in self.conn.execute("SELECT id, fetched_at FROM dishes ORDER BY id")
+        }))
+        write_atomic(os.path.join(meals_dir, "_refresh.json"), json.dumps({
+            str(dish_id): [ttl, unchanged]
+            for dish_id, ttl, unchanged in self.conn.execute(
+                    "SELECT id, ttl, unchanged FROM dishes WHERE ttl IS NOT NULL ORDER BY id")
+        }))
+
+    def close(self):
+        self.conn.close()
+
+
+def open_store(path: str = DB_FILE) -> DishStore:
+    store = DishStore(path)
+    if len(store) == 0 and path != ":memory:":
+        count = store.import_legacy()
+        if count:
+            logging.info(f"Imported {count} dishes from {MEAL_FILE_PREFIX} into {path}")
+    return store
+
+
+def main():
+    # python -m src.store export   rewrite every data/meals/<id>.json from the store
+    if sys.argv[1:] == ["export"]:
+        store = open_store()
+        store.export()
+        store.close()
+    else:
+        print("usage: python -m src.store export", file=sys.stderr)
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,136 @@
 #!/usr/bin/env python3
+import hashlib
 import json
 import logging
 import os
 import re
 import time
-from datetime import datetime
+from collections.abc import Collection, Iterator
+from datetime import date, datetime
 from zoneinfo import ZoneInfo
 
 from bs4 import BeautifulSoup, Tag
 
+from src.clusters import ClusterBuilder
+from src.fetcher import fetch_many
+from src.indexes import DishIndex, open_index
+from src.journal import Journal, open_journal
+from src.labels import LABEL_CLASSIFIER
+from src.metrics import METRICS, METRICS_FILE, profiled
 from src.models import *
+from src.normalize import sanitize_name
+from src.nutrition import build as build_nutrition
+from src.output import JsonArrayWriter, write_atomic
+from src.parsepool import ParsePool, workers_from_env
+from src.parsing import make_soup
+from src.planner import WorkItem, closed_items, hall_closed, load_exceptions, plan_location, to_date
+from src.publish import PUBLISH_ENABLED, publish
+from src.schedule import RefreshScheduler, budget_from_env
+from src.shards import SHARDS_ENABLED, ShardWriter
+from src.store import DishStore, open_store
 from src.util import *
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
-
 DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
 OUT_FILE = os.path.join(DATA_DIR, "thehill.json")
 MEAL_FILE_PREFIX = os.path.join(DATA_DIR, "meals")
-MEAL_CACHE_FILE = os.path.join(MEAL_FILE_PREFIX, "_cache.json")
-MEALCLUSTERS_FILE_PREFIX = os.path.join(DATA_DIR, "mealclusters")
-MEALCLUSTERS_CACHE_FILE = os.path.join(MEALCLUSTERS_FILE_PREFIX, "_cache.json")
+# Not committed (it's about the size of thehill.json and its fetch times change every run),
+# the workflow keeps it in its cache
+FINGERPRINTS_FILE = os.path.join(DATA_DIR, "_fingerprints.json")
 
 MEAL_EXCLUSION_LIST: List[int] = []
-MEAL_CACHE: dict[str, int] = {}
-MEAL_CACHE_INVALIDATIONS: List[int] = []
-MEALCLUSTERS_CACHE: dict[int, List[int]] = {}
-
-BASE_URL = "https://dining.ucla.edu"
+# Max concurrent requests per host, 1 keeps the old one-at-a-time behavior
+CONCURRENCY = int(os.environ.get("MUNCH_CONCURRENCY", "1"))
+
+
+class ScrapeContext:
+    # Everything a scrape reads and writes besides its arguments. The long-lived parts
+    # (dish store, indexes, cluster membership, fingerprints, parse workers) are opened
+    # once and stay warm between runs of the daemon (src/daemon.py); begin_run() resets
+    # the rest.
+    def __init__(self, store: Optional[DishStore] = None, concurrency: int = CONCURRENCY,
+                 parse_workers: Optional[int] = None):
+        # Fetched dish details (payload + fetch time)
+        self.store = store
+        # Label/ingredient/menu indexes (data/indexes.json), updated with changed dishes at the end of a run
+        self.index: Optional[DishIndex] = None
+        # Per-hall dish membership, turned into data/mealclusters/<hall>.json at the end of a run
+        self.clusters: Optional[ClusterBuilder] = None
+        # "<location id>/<y>-<m>-<d>" -> {"hash": ..., "result": <MunchLocationDate>, "at": <fetch time>}
+        self.fingerprints: dict[str, dict] = {}
+        self.concurrency = concurrency
+        # Dish detail pages parsed ahead of time in worker processes (MUNCH_PARSE_WORKERS)
+        self.parse_pool = ParsePool(workers_from_env() if parse_workers is None else parse_workers)
+
+        # Per-dish adaptive TTLs and this run's refetch budget (MUNCH_REFRESH_BUDGET), see src/schedule.py
+        self.scheduler: Optional[RefreshScheduler] = None
+        # Dishes fetched this run, and those whose payload actually changed (the only
+        # ones that dirty a meal cluster)
+        self.fetched: List[int] = []
+        self.changed: set[int] = set()
+        # Pages fetched ahead of time by the concurrent engine, consumed by get_page()
+        self.page_cache: dict[str, str | BaseException] = {}
+        # Checkpoints of this run's pages and dishes (data/_journal.jsonl), so a crashed run
+        # can be resumed; only kept by full runs
+        self.journal: Optional[Journal] = None
+        # Refetch every dish on the scraped pages whatever its TTL (python -m src hill --dishes-only)
+        self.refetch_dishes = False
+
+    def open(self) -> "ScrapeContext":
+        # Loads the store, indexes, clusters and fingerprints, once
+        if self.index is not None:
+            return self
+        if self.store is None:
+            self.store = open_store()
+        self.clusters = ClusterBuilder(self.store)
+        self.index = open_index(self.store)
+        if os.path.exists(FINGERPRINTS_FILE):
+            with open(FINGERPRINTS_FILE, "r") as f:
+                self.fingerprints.update(json.load(f))
+        return self
+
+    def begin_run(self, today: datetime, dishes_only: bool = False, journaled: bool = True):
+        self.open()
+        # Whatever a run that never got to end_run() (it raised, or its generator was
+        # dropped) left behind: prefetched pages, queued parses and the fetch memo, which
+        # would otherwise serve this run the last run's pages
+        self.end_run()
+        FLIGHTS.clear()
+        self.fetched = []
+        self.changed = set()
+        self.refetch_dishes = dishes_only
+
+        # Within the refetch budget, dishes on today's menus (as of the last run) go first
+        self.scheduler = RefreshScheduler(self.store, budget_from_env(), MEAL_EXCLUSION_LIST)
+        self.scheduler.plan(self.index.dishes_on(f"{today.year}-{today.month}-{today.day}"))
+
+        # Pages and dishes an interrupted run already got through (or the last run in
+        # this process, if it failed). A partial run leaves the journal alone for the
+        # next full one.
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        if not journaled:
+            return
+        self.journal = open_journal(f"{today.year}-{today.month}-{today.day}")
+        self.fingerprints.update(self.journal.pages)
+        for dish_id, changed in self.journal.dishes.items():
+            self.fetched.append(dish_id)
+            if changed:
+                self.changed.add(dish_id)
+
+    def end_run(self):
+        # Anything prefetched or handed to the parse workers but never read (e.g. after an error) is dropped
+        self.page_cache.clear()
+        self.parse_pool.clear()
+
+    def close(self):
+        self.parse_pool.close()
+        if self.store is not None:
+            self.store.close()
+        self.store = self.index = self.clusters = None
+
+# MUNCH_BASE_URL points the scraper somewhere else, e.g. the mock site (python -m bench.mocksite)
+BASE_URL = os.environ.get("MUNCH_BASE_URL", "https://dining.ucla.edu").rstrip("/")
 LOCATIONS = {
     "Bruin Plate": ["/bruin-plate", 865],
     "De Neve": ["/de-neve-dining", 866],
@@ -81,89 +184,111 @@ ZERO_MUNCH_NUTRITION = MunchNutrition(
         # vD=MunchNutritionEntry(pdv=0, amt=0, u="µg"),
 )
 
-# Submit a PR if the following lists are not exhaustive or trigger false positives
-# I used ChatGPT cut me some slack
-
-PORK_MATCHES = [
-    "pork", "porcine", "hog", "swine", "pig",
-    "bacon", "ham", "prosciutto", "pancetta", "guanciale",  # "turkey bacon" is so annoying
-    "lard", "gelatin",
-    "char siu", "tonkotsu", "chashu"
-]
-
-BEEF_MATCHES = [
-    "beef", "bovine", "cow", "cattle",
-    "steak", "brisket", "short rib", "ribeye",
-    "sirloin", "carne asada", "bulgogi", "pastrami"
-]
-
-CHICKEN_MATCHES = [
-    "chicken", "hen", "rooster", "cockerel", "broiler",
-    # "chicken breast", "chicken thigh", "chicken wing",
-    # "chicken leg", "chicken drumstick",
-    # "chicken fat", "chicken skin",
-    # "chicken broth", "chicken stock",
-    # "chicken meal", "chicken powder",
-    # "chicken extract", "chicken flavor",
-    "poulet", "pollo", "ayam", "gai", "tori"
-]
-
-
-def generate_extra_labels(name: str) -> List[LABEL]:
-    labels: List[LABEL] = []
-    name = name.lower().strip()
-    # Check for pork or gelatin or ham or any pig-stuff
-    if bool(re.search(rf"\b({'|'.join(map(re.escape, PORK_MATCHES))})\b", name, re.I)) and "turkey bacon" not in name:
-        labels.append("Pork")
-    # Check for any beef products
-    if bool(re.search(rf"\b({'|'.join(map(re.escape, BEEF_MATCHES))})\b", name, re.I)):
-        labels.append("Beef")
-    # Check for any chicken products
-    if bool(re.search(rf"\b({'|'.join(map(re.escape, CHICKEN_MATCHES))})\b", name, re.I)):
-        labels.append("Chicken")
-    return labels
-
-
-def sanitize_name(name: str) -> str:
-    name = name.strip().lower()  # Only lowercase
-    s = name.split(" ")
-
-    # Remove any words with numbers or special characters
-    s = [word for word in s if not re.match(r".*[0-9].*", word) and not re.match(r".*[^a-zA-Z].*", word)]
-
-    # Remove any of these
-    ABBRS = ["oz", "lb", "ct", "select",
-             "sp"]  # ["g", "kg", "ml", "l", "tbsp", "tsp", "cup", "pint", "quart", "gallon"]
-    s = [word for word in s if word not in ABBRS]
-
-    # Move any color words to the beginning of the list
-    COLORS = ["red", "blue", "green", "yellow", "orange", "purple", "pink", "black", "white", "brown", "gray", "silver",
-              "gold"]
-    s = [word for word in s if word in COLORS] + [word for word in s if word not in COLORS]
-
-    # Move any word ending in "ed" to the start of the list
-    s = [word for word in s if re.match(r".*[Ee]d.*", word)] + [word for word in s if not re.match(r".*[Ee]d.*", word)]
-
-    # Move any word ending in "ing" to the start of the list
-    # s = [word for word in s if not re.match(r".*[Ii]ng.*", word)] + [word for word in s if re.match(r".*[Ii]ng.*", word)]
-    # Move any word ending in "ly" to the start of the list
-    # s = [word for word in s if not re.match(r".*[Ll]y.*", word)] + [word for word in s if re.match(r".*[Ll]y.*", word)]
-
-    # Move any word in the following list to the start of the list
-    CUSTOM_START_WORDS = ["fresh"]
-    s = [word for word in s if word in CUSTOM_START_WORDS] + [word for word in s if word not in CUSTOM_START_WORDS]
-
-    # Move any word in the following list to the end of the list
-    CUSTOM_END_WORDS = ["gelato"]
-    s = [word for word in s if word not in CUSTOM_END_WORDS] + [word for word in s if word in CUSTOM_END_WORDS]
-
-    # Recreate word
-    return " ".join(s).title()
+# Synthetic times for "All Day" menus
+ALL_DAY_START = MunchTime(h=12, m=0, z="AM")
+ALL_DAY_END = MunchTime(h=11, m=59, z="PM")
+
+
+def get_page(ctx: ScrapeContext, url: str) -> str:
+    page = ctx.page_cache.pop(url, None)
+    if page is None:
+        return fetch(url)
+    if isinstance(page, BaseException):
+        raise page
+    return page
+
+
+def prefetch(ctx: ScrapeContext, urls: List[str]):
+    if ctx.concurrency <= 1:
+        return
+    with METRICS.stage("prefetch"):
+        ctx.page_cache.update(fetch_many([url for url in urls if url not in ctx.page_cache], ctx.concurrency))
+
+
+def parse_dish_link(dish: Tag) -> tuple[str, int]:
+    link_to_meal_details = BASE_URL + dish.select_one("div.see-menu-details a").get("href").strip()
+    # Format https://dining.ucla.edu/menu-item/?recipe=7361
+    dish_id = 0
+    if "?recipe=" in link_to_meal_details:
+        dish_id = int(link_to_meal_details.split("?recipe=")[1] or 0)
+    elif "?ingredient=" in link_to_meal_details:
+        dish_id = int(link_to_meal_details.split("?ingredient=")[1] or 0)
+    return link_to_meal_details, dish_id
+
+
+def dish_cache_state(ctx: ScrapeContext, dish_id: int) -> str:
+    # "hit", "miss", "expired", "deferred" (due but over budget, served from the store) or "excluded"
+    state = ctx.scheduler.state(dish_id)
+    if ctx.refetch_dishes and state in ("hit", "deferred"):
+        return "expired"
+    return state
+
+
+def is_dish_cached(ctx: ScrapeContext, dish_id: int) -> bool:
+    return dish_cache_state(ctx, dish_id) in ("hit", "deferred")
+
+
+def prefetch_location_dishes(ctx: ScrapeContext, soup: Tag, hours: Optional[InternalMunchLocationHours]):
+    # Only the cards parse_location_meal_periods will read, so nothing is fetched that
+    # the sequential path wouldn't fetch
+    if ctx.concurrency <= 1 and not ctx.parse_pool.enabled:
+        return
+    cards = {}
+    for dish in (
+        dish
+        for _, _, menu_bowl in iter_meal_periods(soup, hours)
+        for _, menu in iter_station_menus(menu_bowl)
+        for dish in menu.select("section.recipe-card")
+    ):
+        if not dish.select_one("div.see-menu-details a"):
+            continue
+        name, allergens, link_to_meal_details, dish_id = parse_dish_card(dish)
+        if not is_dish_cached(ctx, dish_id) and link_to_meal_details not in cards:
+            cards[link_to_meal_details] = (name, dish_id, allergens)
+    prefetch(ctx, list(cards))
+    if not ctx.parse_pool.enabled:
+        return
+    for link_to_meal_details, (name, dish_id, allergens) in cards.items():
+        try:
+            html = get_page(ctx, link_to_meal_details)
+        except Exception as e:
+            # Put it back so the error surfaces where the dish is parsed, like the sequential path
+            ctx.page_cache[link_to_meal_details] = e
+            continue
+        ctx.parse_pool.submit(link_to_meal_details, build_dish, name, dish_id, allergens, html)
+
+
+def menu_fingerprint(raw_html: str, hours: InternalMunchLocationHours, is_today: bool) -> str:
+    # Scripts, styles and comments carry nonces/build ids that change every request
+    html = re.sub(r"<script\b.*?</script>|<style\b.*?</style>|<!--.*?-->", "", raw_html, flags=re.S | re.I)
+    h = hashlib.sha256()
+    h.update(html.encode("utf-8"))
+    # The parsed result also depends on the hours (period times) and on whether
+    # this is today (fallback periods), so those are part of the fingerprint
+    h.update(hours.model_dump_json().encode("utf-8"))
+    h.update(b"today" if is_today else b"")
+    return h.hexdigest()
+
+
+def reuse_location_date(ctx: ScrapeContext, key: str, fingerprint: Optional[str] = None) -> Optional[MunchLocationDate]:
+    # Without a fingerprint (the planner skipped the page) the last result is taken as is
+    entry = ctx.fingerprints.get(key)
+    if not entry or (fingerprint is not None and entry["hash"] != fingerprint):
+        return None
+    # Our own earlier output, no need to validate it again
+    location_date = construct(MunchLocationDate, entry["result"])
+    # Dishes that are due for a refresh can only be refetched by a full parse
+    for period in location_date.periods:
+        for station in period.stations:
+            for dish_id in station.dishes:
+                if not is_dish_cached(ctx, dish_id):
+                    return None
+    return location_date
 
 
 def parse_dish_ingredients(soup: Tag) -> List[MunchIngredient]:
     raw_ingredients: List[Tag] = []
-    parsed_ingredients: List[MunchIngredient] = []
+    parsed_ingredients: List[dict] = []
     p = soup.select_one("p > strong")
     p_text = p.get_text(strip=True)
     if p_text == "Ingredients:":
@@ -176,6 +301,8 @@ def parse_dish_ingredients(soup: Tag) -> List[MunchIngredient]:
                 raw_ingredients.append(li)
     else:
         raw_ingredients.append(p)
+    names: List[str] = []
+    site_labels: List[List[LABEL]] = []
     for ri in raw_ingredients:
         labels: List[LABEL: str] = []
         for strong in ri.select("strong"):
@@ -187,15 +314,18 @@ def parse_dish_ingredients(soup: Tag) -> List[MunchIngredient]:
                 labels.append(lbl.strip())
             strong.decompose()
         ingredient_name = re.split(r'[:(\[]', ri.get_text(strip=True), maxsplit=1)[0].strip().title()
-        ingredient_name = sanitize_name(ingredient_name)
-        labels = list(set(labels)) + generate_extra_labels(ingredient_name)
+        names.append(sanitize_name(ingredient_name))
+        site_labels.append(list(set(labels)))
+    # Label every ingredient of the dish in one pass, then validate them as one list
+    for ingredient_name, labels, extra_labels in zip(names, site_labels, LABEL_CLASSIFIER.classify_many(names)):
         # paragraph += f"{ingredient_name} ({', '.join(labels)})"
-        parsed_ingredients.append(MunchIngredient(name=ingredient_name, labels=sorted(labels)))
-    return parsed_ingredients
+        parsed_ingredients.append({"name": ingredient_name, "labels": sorted(labels + extra_labels)})
+    return MunchIngredientList.validate_python(parsed_ingredients)
 
 
 def parse_dish_nutrition(soup: Tag) -> MunchNutrition:
-    mn: dict[str, int | float | MunchNutritionEntry] = dict()
+    # Raw values only, validated once as a whole below
+    mn: dict[str, int | float | dict] = dict()
     # Serving Size
     # mn["servingSize"] = float(soup.find_all(string=True, recursive=False)[0].strip().replace("oz", ""))
     text = soup.find_all(string=True, recursive=False)[0].strip().lower()
@@ -274,129 +404,163 @@ def parse_dish_nutrition(soup: Tag) -> MunchNutrition:
             key = "vD"
         else:
             continue
-        mn[key] = MunchNutritionEntry(pdv=pdv, amt=round(float(n), 2))
+        mn[key] = {"pdv": pdv, "amt": round(float(n), 2)}
     return safe_parse(MunchNutrition, mn) or ZERO_MUNCH_NUTRITION
 
 
-def parse_location_dishes(soup: Tag) -> List[int]:
+def parse_dish_card(dish: Tag) -> tuple[str, List[str], str, int]:
+    name = dish.select_one("div.menu-item-title div.ucla-prose h3").get_text(strip=True).replace("w/ ",
+                                                                                                 "w/").replace("w/",
+                                                                                                               "w/ ")
+    allergen_labels = dish.select_one("div.menu-item-meta-data")
+    allergens = []
+    if allergen_labels:
+        allergens = [label.get("title").strip().title() for label in allergen_labels.select("img")]
+    link_to_meal_details, dish_id = parse_dish_link(dish)
+    return name, allergens, link_to_meal_details, dish_id
+
+
+def build_dish(name: str, dish_id: int, allergens: List[str], html: str) -> str:
+    # Runs in a parse worker when the parse pool is enabled, so it only touches its arguments
+    allergens = list(allergens)
+    meal_details_bowl = make_soup(html, "dish")
+    dish_ingredients: List[MunchIngredient] = list()
+    dish_nutrition: MunchNutrition
+    scg = meal_details_bowl.select_one(".single-complex-grid")
+    if scg:
+        lis = scg.select("li")
+        texts = [li.select_one("a").get_text(strip=True) for li in lis]
+        rows = []
+        for li, text, extra_labels in zip(lis, texts, LABEL_CLASSIFIER.classify_many(texts)):
+            sub_allergens = list(map(lambda x: x.get("title").strip().title(), li.select("img"))) + extra_labels
+            rows.append({"name": text, "labels": sorted(sub_allergens)})
+        dish_ingredients = MunchIngredientList.validate_python(rows)
+        # nutrition_div = meal_details_bowl.select_one("div#nutrition")
+        dish_nutrition = ZERO_MUNCH_NUTRITION
+    else:
+        dish_ingredients = parse_dish_ingredients(meal_details_bowl.select_one("div#ingredient_list"))
+        dish_nutrition = parse_dish_nutrition(meal_details_bowl.select_one("div#nutrition"))
+    for ingredient in dish_ingredients:
+        for label in ingredient.labels:
+            if label not in allergens:
+                allergens.append(label)
+    # Ingredients and nutrition are already validated models and pass straight through,
+    # only the card's name and labels are checked here
+    dish = MunchDish(
+            name=name,
+            id=dish_id,
+            labels=sorted(allergens),
+            ingredients=dish_ingredients,
+            nutrition=dish_nutrition,
+    )
+    return dish.model_dump_json()
+
+
+def parse_location_dishes(ctx: ScrapeContext, soup: Tag) -> List[int]:
     dishes = []
     for dish in soup.select("section.recipe-card"):
-        name = dish.select_one("div.menu-item-title div.ucla-prose h3").get_text(strip=True).replace("w/ ",
-                                                                                                     "w/").replace("w/",
-                                                                                                                   "w/ ")
-        allergen_labels = dish.select_one("div.menu-item-meta-data")
-        allergens = []
-        if allergen_labels:
-            allergens = [label.get("title").strip().title() for label in allergen_labels.select("img")]
-        link_to_meal_details = BASE_URL + dish.select_one("div.see-menu-details a").get("href").strip()
-        # Format https://dining.ucla.edu/menu-item/?recipe=7361
-        dish_id = 0
-        if "?recipe=" in link_to_meal_details:
-            dish_id = int(link_to_meal_details.split("?recipe=")[1] or 0)
-        elif "?ingredient=" in link_to_meal_details:
-            dish_id = int(link_to_meal_details.split("?ingredient=")[1] or 0)
-        dish_path = os.path.join(DATA_DIR, "meals", f"{dish_id}.json")
-        if str(dish_id) not in MEAL_CACHE or MEAL_CACHE[str(dish_id)] is None:
-            MEAL_CACHE[str(dish_id)] = 0
-        if os.path.exists(dish_path) and (dish_id not in MEAL_EXCLUSION_LIST) and (abs(MEAL_CACHE[str(dish_id)] - int(time.time())) < 60*60*24*15):
+        name, allergens, link_to_meal_details, dish_id = parse_dish_card(dish)
+        cache_state = dish_cache_state(ctx, dish_id)
+        METRICS.count(f"dishes.cache.{cache_state}")
+        if cache_state == "hit":
             logging.info(f"CACHE HIT for meal #{dish_id}")
+        elif cache_state == "deferred":
+            logging.info(f"REFRESH DEFERRED for meal #{dish_id}")
         else:
-            meal_details_bowl = BeautifulSoup(fetch(link_to_meal_details), "html.parser")
-            dish_ingredients: List[MunchIngredient] = list()
-            dish_nutrition: MunchNutrition
-            scg = meal_details_bowl.select_one(".single-complex-grid")
-            if scg:
-                lis = scg.select("li")
-                for li in lis:
-                    text = li.select_one("a").get_text(strip=True)
-                    sub_allergens = list(
-                        map(lambda x: x.get("title").strip().title(), li.select("img"))) + generate_extra_labels(text)
-                    dish_ingredients.append(MunchIngredient(name=text, labels=sorted(sub_allergens)))
-                # nutrition_div = meal_details_bowl.select_one("div#nutrition")
-                dish_nutrition = ZERO_MUNCH_NUTRITION
+            parsed = ctx.parse_pool.take(link_to_meal_details)
+            if parsed is not None:
+                with METRICS.stage("parse.dish"):
+                    payload = parsed.result()
             else:
-                dish_ingredients = parse_dish_ingredients(meal_details_bowl.select_one("div#ingredient_list"))
-                dish_nutrition = parse_dish_nutrition(meal_details_bowl.select_one("div#nutrition"))
-            for ingredient in dish_ingredients:
-                for label in ingredient.labels:
-                    if label not in allergens:
-                        allergens.append(label)
-            dish = MunchDish(
-                    name=name,
-                    id=dish_id,
-                    labels=sorted(allergens),
-                    ingredients=dish_ingredients,
-                    nutrition=dish_nutrition,
-            )
-            with open(dish_path, "w") as f:
-                f.write(dish.model_dump_json())
-                MEAL_CACHE[str(dish_id)] = int(time.time())
-                MEAL_CACHE_INVALIDATIONS.append(dish_id)
+                html = get_page(ctx, link_to_meal_details)
+                with METRICS.stage("parse.dish"):
+                    payload = build_dish(name, dish_id, allergens, html)
+            changed = ctx.store.put(dish_id, payload, int(time.time()))
+            if changed:
+                ctx.changed.add(dish_id)
+            ctx.scheduler.record(dish_id, changed, new=cache_state == "miss")
+            ctx.fetched.append(dish_id)
+            if ctx.journal:
+                ctx.journal.dish(dish_id, changed)
         dishes.append(dish_id)
     return dishes
 
 
-def parse_location_stations(soup: Tag) -> List[MunchStationMenu]:
-    stations = []
-    for station in soup.select("div.meal-station"):
-        name = station.select_one("div.cat-heading-box .category-heading h2").get_text(strip=True)
+def iter_station_menus(menu_bowl: Tag) -> Iterator[tuple[Tag, Tag]]:
+    # (station, its recipe list) for every station with a menu
+    for station in menu_bowl.select("div.meal-station"):
         menu = station.select_one("div.recipe-list")
         if menu:
-            dishes = parse_location_dishes(menu)
-            # for dish in dishes:
-            #     with open(os.path.join(DATA_DIR, "meals", f"{dish.id}.json"), "w") as f:
-            #         f.write(dish.model_dump_json())
-            stations.append(MunchStationMenu(name=name, dishes=dishes))
+            yield station, menu
+
+
+def parse_location_stations(ctx: ScrapeContext, soup: Tag) -> List[MunchStationMenu]:
+    stations = []
+    for station, menu in iter_station_menus(soup):
+        name = station.select_one("div.cat-heading-box .category-heading h2").get_text(strip=True)
+        dishes = parse_location_dishes(ctx, menu)
+        # for dish in dishes:
+        #     with open(os.path.join(DATA_DIR, "meals", f"{dish.id}.json"), "w") as f:
+        #         f.write(dish.model_dump_json())
+        stations.append(MunchStationMenu(name=name, dishes=dishes))
     return stations
 
 
-def parse_location_meal_periods(soup: BeautifulSoup, hours: InternalMunchLocationHours) -> List[MunchMealPeriod]:
-    periods = []
-    scraping_info = {
-        "All Day": {
-            "selector": "#alldaymenu.anchor-float",
-            "label": "All Day"
-        },
-        "Breakfast": {
-            "selector": "#breakfastmenu.anchor-float",
-            "label": "Breakfast"
-        },
-        "Lunch": {
-            "selector": "#lunchmenu.anchor-float",
-            "label": "Lunch"
-        },
-        "Dinner": {
-            "selector": "#dinnermenu.anchor-float",
-            "label": "Dinner"
-        },
-        "Late Night": {
-            "selector": "#latenightmenu.anchor-float",
-            "label": "Late Night"
-        }
+MEAL_PERIODS = {
+    "All Day": {
+        "selector": "#alldaymenu.anchor-float",
+        "label": "All Day"
+    },
+    "Breakfast": {
+        "selector": "#breakfastmenu.anchor-float",
+        "label": "Breakfast"
+    },
+    "Lunch": {
+        "selector": "#lunchmenu.anchor-float",
+        "label": "Lunch"
+    },
+    "Dinner": {
+        "selector": "#dinnermenu.anchor-float",
+        "label": "Dinner"
+    },
+    "Late Night": {
+        "selector": "#latenightmenu.anchor-float",
+        "label": "Late Night"
     }
+}
+
 
-    for meal in scraping_info:
-        meal_period = soup.select_one(scraping_info[meal]["selector"])
+def iter_meal_periods(soup: BeautifulSoup, hours: Optional[InternalMunchLocationHours]) -> Iterator[tuple[str, str, Tag]]:
+    # (meal, label, menu) for every meal period on a date page that makes it into the output
+    for meal in MEAL_PERIODS:
+        meal_period = soup.select_one(MEAL_PERIODS[meal]["selector"])
         if meal_period:
             meal_period = meal_period.find_next_sibling()
             label_text = meal_period.select_one("h2").get_text(strip=True)
-            # if label_text.lower() == scraping_info[meal]["label"].lower():
+            # if label_text.lower() == MEAL_PERIODS[meal]["label"].lower():
             menu_bowl = meal_period.select_one(".wp-block-columns.alignwide .at-a-glance-menu__dining-location")
-            if menu_bowl:
-                stations = parse_location_stations(menu_bowl)
-                # All Day uses synthetic 12am–11:59pm times, so the hours model
-                # need not carry an entry for it. Every other meal still needs
-                # the hours-derived start/end times.
-                dumped = hours.model_dump() if hours is not None else {}
-                if meal != "All Day" and dumped.get(meal) is None:
-                    continue
-                meal_period = MunchMealPeriod(
-                        name=label_text.title(),  # scraping_info[meal]["label"],
-                        startTime=dumped.get(meal)["startTime"] if meal != "All Day" else MunchTime(h=12, m=0, z="AM"),
-                        endTime=dumped.get(meal)["endTime"] if meal != "All Day" else MunchTime(h=11, m=59, z="PM"),
-                        stations=stations
-                )
-                periods.append(meal_period)
+            # All Day uses synthetic 12am–11:59pm times, so the hours model need not
+            # carry an entry for it. Every other meal needs the hours-derived start/end
+            # times, without them the period is dropped (and its dishes aren't fetched)
+            if menu_bowl and (meal == "All Day" or getattr(hours, meal, None) is not None):
+                yield meal, label_text, menu_bowl
+
+
+def parse_location_meal_periods(ctx: ScrapeContext, soup: BeautifulSoup,
+                                hours: InternalMunchLocationHours) -> List[MunchMealPeriod]:
+    periods = []
+    for meal, label_text, menu_bowl in iter_meal_periods(soup, hours):
+        stations = parse_location_stations(ctx, menu_bowl)
+        # The hours entries are validated models already, reuse their MunchTimes
+        # instead of dumping and re-validating them for every period
+        entry = getattr(hours, meal, None)
+        meal_period = MunchMealPeriod(
+                name=label_text.title(),  # MEAL_PERIODS[meal]["label"],
+                startTime=entry.startTime if meal != "All Day" else ALL_DAY_START,
+                endTime=entry.endTime if meal != "All Day" else ALL_DAY_END,
+                stations=stations
+        )
+        periods.append(meal_period)
 
     # bm = soup.select_one("#breakfastmenu.anchor-float")
     # breakfast_menu = bm.find_next_sibling() if bm else None
@@ -467,77 +631,185 @@ def parse_location_dates(soup: BeautifulSoup) -> List[MunchDate]:
     return dates
 
 
-def parse_locations() -> List[MunchLocation]:
-    global MEAL_CACHE, MEALCLUSTERS_CACHE
-
-    with open(MEAL_CACHE_FILE, "r") as f:
-        MEAL_CACHE = json.load(f)
-
-    # with open(MEALCLUSTERS_CACHE_FILE, "r") as f:
-    #     MEALCLUSTERS_CACHE = json.load(f)
+def parse_location_page(ctx: ScrapeContext, loc_url: str) -> tuple[Optional[InternalMunchLocationHours], List[MunchDate]]:
+    loc_html = get_page(ctx, loc_url)
+    with METRICS.stage("parse"):
+        soup = make_soup(loc_html, "location")
+
+        # Parse hours schedule
+        hours_bowl = soup.select_one(".dining-hours-summary")
+        hours = (
+            parse_location_hours(hours_bowl)
+            if hours_bowl
+            else None
+        )
+
+        # Parse future days list
+        dates_bowl = soup.select_one("select")
+        dates = (
+            parse_location_dates(dates_bowl)
+            if dates_bowl
+            else []
+        )
+    return hours, dates
+
+
+def plan_location_date(ctx: ScrapeContext, item: WorkItem, hours: InternalMunchLocationHours, today: datetime,
+                       force: bool = False) -> Optional[MunchLocationDate]:
+    # force parses the page again even if its fingerprint hasn't changed
+    METRICS.count(f"plan.{item.action}")
+    if item.action == "closed":
+        logging.info(f"CLOSED {item.key}, not fetched")
+        return MunchLocationDate(date=item.date, periods=[])
+    if item.action in ("reuse", "resume"):
+        location_date = reuse_location_date(ctx, item.key)
+        if location_date:
+            logging.info(f"REUSED {item.key}, " + ("done before the last run stopped" if item.action == "resume"
+                                                   else "not due for a refresh"))
+            return location_date
+        # Some of its dishes are due, so the page has to be parsed again
+        METRICS.count("plan.reuseMissed")
+
+    is_today = to_date(item.date) == today.date()
+    raw_html = get_page(ctx, item.url)
+    if item.location_id == 868:
+        raw_html = raw_html.replace('breakfastmenu', 'dinnermenu')
+
+    with METRICS.stage("fingerprint"):
+        fingerprint = menu_fingerprint(raw_html, hours, is_today)
+        location_date = None if force else reuse_location_date(ctx, item.key, fingerprint)
+    if location_date:
+        logging.info(f"FINGERPRINT HIT for {item.key}")
+        METRICS.count("menus.fingerprint.hit")
+    else:
+        METRICS.count("menus.fingerprint.miss")
+        with METRICS.stage("parse"):
+            location_date_soup = make_soup(raw_html, "date")
+            prefetch_location_dishes(ctx, location_date_soup, hours)
+            location_date_periods = parse_location_meal_periods(ctx, location_date_soup, hours)
+
+            # verify we at least have what "hours" specifices for today
+            if is_today and len(location_date_periods) == 0:
+                if hours is not None:
+                    for k, v in hours.model_dump().items():
+                        if v is not None:
+                            location_date_periods.append(MunchMealPeriod(
+                                    name=k,
+                                    startTime=v["startTime"],
+                                    endTime=v["endTime"],
+                                    stations=[]
+                            ))
+
+        location_date = safe_parse(MunchLocationDate, {
+            "date": item.date,
+            "periods": location_date_periods,
+        })
+    if location_date:
+        ctx.fingerprints[item.key] = {
+            "hash": fingerprint,
+            "result": location_date.model_dump(mode="json"),
+            # Fetch time, how the planner decides when a far-off date is due again
+            "at": int(time.time()),
+        }
+        if ctx.journal:
+            ctx.journal.page(item.key, ctx.fingerprints[item.key])
+    return location_date
 
-    locations = []
 
+def find_location(value: str) -> Optional[int]:
+    # Location id from its id, name or slug ("865", "bruin plate", "bruin-plate")
     for loc_name, loc_data in LOCATIONS.items():
-        if loc_data[1] not in MEALCLUSTERS_CACHE:
-            MEALCLUSTERS_CACHE[loc_data[1]] = []
-
+        if value.strip("/").lower() in (str(loc_data[1]), loc_name.lower(), loc_data[0].strip("/")):
+            return loc_data[1]
+    return None
+
+
+def previous_locations() -> dict[int, MunchLocation]:
+    # The last run's output, for merging a partial scrape into it
+    if not os.path.exists(OUT_FILE):
+        return {}
+    with open(OUT_FILE, "r") as f:
+        return {location["id"]: construct(MunchLocation, location) for location in json.load(f)}
+
+
+def merge_location_dates(previous: Optional[MunchLocation], location_dates: List[MunchLocationDate],
+                         replaced: Collection[date], today: date) -> List[MunchLocationDate]:
+    # The scraped dates replace those in replaced, every other date of the last run from today on is kept
+    kept = [
+        d for d in previous.dates
+        if to_date(d.date) not in replaced and to_date(d.date) >= today
+    ] if previous else []
+    return sorted(kept + location_dates, key=lambda d: to_date(d.date))
+
+
+def iter_locations(only: Optional[Collection[int]] = None, dates: Optional[Collection[date]] = None,
+                   dishes_only: bool = False, clusters: bool = True, force: Optional[bool] = None,
+                   ctx: Optional[ScrapeContext] = None) -> Iterator[MunchLocation]:
+    # Yields each location as soon as it's parsed; the store, clusters and fingerprints
+    # are written once the generator is exhausted.
+    #   only         location ids to scrape (default: all of LOCATIONS)
+    #   dates        dates to scrape (default: every listed date from today on); the
+    #                yielded locations still have the last run's other dates
+    #   dishes_only  refetch every dish on the scraped pages, leave menus/clusters membership alone
+    #   clusters     rebuild data/mealclusters/ at the end
+    #   force        parse pages again even if their fingerprint hasn't changed
+    #                (default: only for a targeted run, i.e. with only or dates)
+    #   ctx          state to scrape with (default: a fresh one, closed at the end)
+    if force is None:
+        force = only is not None or dates is not None
+    locations = {
+        loc_name: loc_data for loc_name, loc_data in LOCATIONS.items()
+        if only is None or loc_data[1] in only
+    }
+    previous = previous_locations() if dates is not None and not dishes_only else {}
+
+    owned = ctx is None
+    ctx = ctx or ScrapeContext()
+    today = datetime.now(ZoneInfo("America/Los_Angeles"))
+    # Only a run over every location and date resumes (and then deletes) the journal
+    full_run = only is None and dates is None and not dishes_only
+    ctx.begin_run(today, dishes_only, journaled=full_run)
+
+    # Dates closed all day (per data/exceptions.json) aren't fetched, but the location
+    # page always is, since it lists the dates the hall reopens
+    exceptions = load_exceptions()
+    prefetch(ctx, [BASE_URL + loc_data[0] for loc_data in locations.values()])
+
+    for loc_name, loc_data in locations.items():
+        loc_start = time.perf_counter()
         try:
             loc_url = BASE_URL + loc_data[0]
-            soup = BeautifulSoup(fetch(loc_url), "html.parser")
-
-            # Parse hours schedule
-            hours_bowl = soup.select_one(".dining-hours-summary")
-            hours = (
-                parse_location_hours(hours_bowl)
-                if hours_bowl
-                else None
-            )
-
-            # Parse future days list
-            today = datetime.now(ZoneInfo("America/Los_Angeles"))
-            dates_bowl = soup.select_one("select")
-            dates = (
-                parse_location_dates(dates_bowl)
-                if dates_bowl
-                else []
-            )
+            hall_exceptions = exceptions.get(loc_data[1], [])
+            hours, listed_dates = parse_location_page(ctx, loc_url)
 
             # Case where select is empty but today has hours
-            if len(dates) == 0 and hours is not None:
-                dates = [MunchDate(y=today.year, m=today.month, d=today.day)]
+            if len(listed_dates) == 0 and hours is not None:
+                listed_dates = [MunchDate(y=today.year, m=today.month, d=today.day)]
+
+            # Need to fix/redo for Bruin Bowl
+            if hours is not None:
+                items = plan_location(loc_data[1], loc_url, listed_dates, today.date(), hall_exceptions,
+                                      ctx.fingerprints, ctx.journal.pages if ctx.journal else ())
+            elif hall_closed(hall_exceptions, today.date()):
+                # No hours since it's closed, its closed dates still show up (empty)
+                logging.info(f"{loc_name} is closed (data/exceptions.json)")
+                items = closed_items(loc_data[1], today.date())
+            else:
+                items = []
+            if dates is not None:
+                items = [item for item in items if to_date(item.date) in dates]
+            if force:
+                items = [item._replace(action="fetch") if item.action in ("reuse", "resume") else item
+                         for item in items]
+            prefetch(ctx, [item.url for item in items if item.action == "fetch"])
 
-            # Loop over each date >= today and parse meal periods
             location_dates: list[MunchLocationDate] = []
-            for date in dates:
-                if date.d >= today.day:
-                    if hours is None:
-                        continue  # Need to fix/redo for Bruin Bowl
-
-                    raw_html = fetch(loc_url + f"?date={date.y}-{date.m}-{date.d}")
-                    if loc_data[1] == 868:
-                        raw_html = raw_html.replace('breakfastmenu', 'dinnermenu')
-                    location_date_soup = BeautifulSoup(raw_html, "html.parser")
-                    location_date_periods = parse_location_meal_periods(location_date_soup, hours)
-
-                    # verify we at least have what "hours" specifices for today
-                    if date.d == today.day and len(location_date_periods) == 0:
-                        if hours is not None:
-                            for k, v in hours.model_dump().items():
-                                if v is not None:
-                                    location_date_periods.append(MunchMealPeriod(
-                                            name=k,
-                                            startTime=v["startTime"],
-                                            endTime=v["endTime"],
-                                            stations=[]
-                                    ))
-
-                    location_date = safe_parse(MunchLocationDate, {
-                        "date": date,
-                        "periods": location_date_periods,
-                    })
-                    if location_date:
-                        location_dates.append(location_date)
+            for item in items:
+                location_date = plan_location_date(ctx, item, hours, today, force=force)
+                if location_date:
+                    location_dates.append(location_date)
+            if dates is not None and not dishes_only:
+                location_dates = merge_location_dates(previous.get(loc_data[1]), location_dates, dates, today.date())
 
             location_data = {
                 "name": loc_name,
@@ -547,60 +819,127 @@ def parse_locations() -> List[MunchLocation]:
             }
             location = safe_parse(MunchLocation, location_data)
             if location:
-                locations.append(location)
-                MEALCLUSTERS_CACHE[loc_data[1]] = list(set([
+                dish_ids = {
                     dish
                     for mld in location_dates
                     for period in mld.periods
                     for station in period.stations
                     for dish in station.dishes
-                ]))
+                }
+                if not dishes_only:
+                    if clusters:
+                        ctx.clusters.set_members(loc_data[1], dish_ids)
+                    ctx.index.set_menus(location)
+                METRICS.location(loc_name, time.perf_counter() - loc_start, dates=len(location_dates),
+                                 dishes=len(dish_ids))
+                yield location
+            else:
+                METRICS.location(loc_name, time.perf_counter() - loc_start, error="validation")
 
-        except Exception:
+        except Exception as e:
             logging.exception(f"Error parsing location {loc_name}")
+            METRICS.count("locations.errors")
+            METRICS.location(loc_name, time.perf_counter() - loc_start, error=type(e).__name__)
+
+    ctx.end_run()
+
+    repeated = sum(1 for n in FLIGHTS.requested.values() if n > 1)
+    logging.info(f"{len(FLIGHTS.requested)} URLs requested, {FLIGHTS.duplicates()} duplicate requests "
+                 f"({FLIGHTS.coalesced} coalesced, {FLIGHTS.memo_hits} already fetched) for {repeated} URLs")
+    METRICS.count("fetch.urls", len(FLIGHTS.requested))
+    METRICS.count("fetch.coalesced", FLIGHTS.coalesced)
+    METRICS.count("fetch.memoHits", FLIGHTS.memo_hits)
+    METRICS.count("fetch.repeatedUrls", repeated)
+    FLIGHTS.clear()
+
+    METRICS.count("dishes.fetched", len(ctx.fetched))
+    METRICS.count("dishes.changed", len(ctx.changed))
+
+    if clusters:
+        with METRICS.stage("clusters"):
+            METRICS.count("clusters.written", len(ctx.clusters.build(ctx.changed)))
+
+    # Per-dish JSON files are only rewritten for dishes fetched this run
+    with METRICS.stage("write"):
+        ctx.store.export(MEAL_FILE_PREFIX, ctx.fetched)
+    # Columnar nutrition for every stored dish (data/nutrition.npy), for src.nutrition queries
+    with METRICS.stage("nutrition"):
+        build_nutrition(ctx.store)
+    with METRICS.stage("index"):
+        ctx.index.update(ctx.store.get_many(ctx.changed))
+        ctx.index.save()
+
+    # Past dates will never be requested again
+    today = datetime.now(ZoneInfo("America/Los_Angeles"))
+    for key in [
+        key for key, entry in ctx.fingerprints.items()
+        if (entry["result"]["date"]["y"], entry["result"]["date"]["m"], entry["result"]["date"]["d"])
+           < (today.year, today.month, today.day)
+    ]:
+        del ctx.fingerprints[key]
+    write_atomic(FINGERPRINTS_FILE, json.dumps(ctx.fingerprints))
+    # Everything the journal covered is on disk now
+    if ctx.journal:
+        ctx.journal.finish()
+        ctx.journal = None
+    if owned:
+        ctx.close()
 
-    for hall_id, hall_dish_ids in MEALCLUSTERS_CACHE.items():
-        cluster_path = os.path.join(MEALCLUSTERS_FILE_PREFIX, f"{hall_id}.json")
-        cluster: Optional[List[MunchDish]] = None
-
-        if os.path.exists(cluster_path):
-            for invalidated_id in MEAL_CACHE_INVALIDATIONS:
-                if invalidated_id in hall_dish_ids:
-                    # recompile this entire hall_id cluster
-                    # cluster.append(next((item for item in MEAL_CACHE if item["id"] == invalidated_id), None))
-                    # cluster = [dish for dish in MEAL_CACHE if dish["id"] in hall_dish_ids]
-                    cluster = []
-                    for cached_meal_id in MEALCLUSTERS_CACHE[hall_id]:
-                        with open(os.path.join(MEAL_FILE_PREFIX, f"{cached_meal_id}.json"), "r") as f:
-                            cluster.append(json.load(f))
-                    break
-            cluster = [x for x in cluster if x is not None] if cluster is not None else None
-        else:
-            cluster = []
-            for cached_meal_id in MEALCLUSTERS_CACHE[hall_id]:
-                with open(os.path.join(MEAL_FILE_PREFIX, f"{cached_meal_id}.json"), "r") as f:
-                    cluster.append(json.load(f))
-            # cluster = [dish for dish in MEAL_CACHE if dish["id"] in hall_dish_ids]
-
-        if cluster is not None:
-            with open(cluster_path, "w") as f:
-                f.write(json.dumps(cluster))
-
-    with open(MEAL_CACHE_FILE, "w") as f:
-        f.write(json.dumps(MEAL_CACHE))
-
-    with open(MEALCLUSTERS_CACHE_FILE, "w") as f:
-        f.write(json.dumps(MEALCLUSTERS_CACHE))
 
-    return locations
-
-
-def main():
-    scraped = parse_locations()
-    data = [json.loads(scrape.model_dump_json()) for scrape in scraped]
-    j = json.dumps(data)
-    with open(OUT_FILE, "w") as f:
-        f.write(j)
+def parse_locations() -> List[MunchLocation]:
+    return list(iter_locations())
+
+
+def write_merged(locations: List[MunchLocation], shards: Optional[ShardWriter]):
+    # A partial scrape replaces its own locations in the last run's output, keeping their order
+    merged = previous_locations()
+    for location in locations:
+        merged[location.id] = location
+    with METRICS.stage("write"):
+        with JsonArrayWriter(OUT_FILE) as out:
+            out.write_all(merged.values())
+        if shards:
+            for location in locations:
+                shards.write(location)
+
+
+def main(only: Optional[Collection[int]] = None, dates: Optional[Collection[date]] = None,
+         dishes_only: bool = False, clusters: bool = True, publish_artifacts: bool = PUBLISH_ENABLED,
+         force: Optional[bool] = None, ctx: Optional[ScrapeContext] = None):
+    # MUNCH_PROFILE=1 to profile the whole run into data/profile.pstats
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    # A fresh set of counters per run (the daemon calls this over and over)
+    METRICS.reset()
+    with profiled():
+        # Per-date shards (data/thehill/) too, so clients only fetch the days that changed
+        shards = ShardWriter() if SHARDS_ENABLED and not dishes_only else None
+        locations = iter_locations(only, dates, dishes_only, clusters, force, ctx)
+        if dishes_only:
+            # Menus aren't touched, only the dish files and what's derived from them
+            for _ in locations:
+                pass
+        elif only is not None or dates is not None:
+            write_merged(list(locations), shards)
+        else:
+            # Each location goes to disk as soon as it's parsed instead of being held until the end
+            with JsonArrayWriter(OUT_FILE) as out:
+                for location in locations:
+                    with METRICS.stage("write"):
+                        out.write(location)
+                        if shards:
+                            shards.write(location)
+        if shards:
+            shards.close()
+            METRICS.count("shards.written", len(shards.written))
+            METRICS.count("shards.removed", len(shards.removed))
+        # Content-hashed, precompressed copies of everything in data/ (data/dist/)
+        if publish_artifacts:
+            with METRICS.stage("publish"):
+                publisher = publish()
+            METRICS.count("publish.written", len(publisher.written))
+            METRICS.count("publish.removed", len(publisher.removed))
+    METRICS.write()
+    logging.info(f"Run metrics written to {METRICS_FILE}")
 
 
 if __name__ == "__main__":
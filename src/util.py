@@ -1,27 +1,124 @@
+import gzip
+import hashlib
+import json
 import logging
+import os
 import time
 from typing import Type, TypeVar, Optional
 
 import requests
 from pydantic import ValidationError, BaseModel
+from requests.adapters import HTTPAdapter
+
+from src.metrics import METRICS
+from src.ratelimit import LIMITER, backoff_delay, retry_after_seconds
+from src.singleflight import SingleFlight
 
 USER_AGENT = "MunchScraper/1.0 (+https://github.com/munchucla/scraper)"
 HEADERS = {"User-Agent": USER_AGENT}
 
+HTTP_CACHE_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "_http")
+HTTP_CACHE_ENABLED = os.environ.get("MUNCH_HTTP_CACHE", "1") != "0"
+
+# One keep-alive pool shared by every fetch (and every fetcher thread)
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+
+class HttpCache:
+    # One gzipped JSON file per URL holding the body and its validators. Only
+    # responses that carry an ETag or Last-Modified are worth keeping.
+    def __init__(self, path: str):
+        self.path = path
+
+    def _file(self, url: str) -> str:
+        return os.path.join(self.path, hashlib.sha1(url.encode()).hexdigest() + ".json.gz")
+
+    def get(self, url: str) -> Optional[dict]:
+        try:
+            with gzip.open(self._file(url), "rt", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get("url") == url else None
+
+    def put(self, url: str, resp: requests.Response):
+        etag = resp.headers.get("ETag")
+        last_modified = resp.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return
+        entry = {"url": url, "etag": etag, "lastModified": last_modified, "body": resp.text}
+        os.makedirs(self.path, exist_ok=True)
+        tmp = self._file(url) + f".{os.getpid()}.tmp"
+        # mtime=0 keeps the bytes of an unchanged entry stable from run to run
+        with open(tmp, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as f:
+            f.write(json.dumps(entry).encode("utf-8"))
+        os.replace(tmp, self._file(url))
+
+    @staticmethod
+    def validators(entry: Optional[dict]) -> dict[str, str]:
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("lastModified"):
+            headers["If-Modified-Since"] = entry["lastModified"]
+        return headers
+
+
+HTTP_CACHE = HttpCache(HTTP_CACHE_DIR)
+
+
+# Worth retrying, after the server's Retry-After if it sends one
+RETRY_STATUSES = {429, 503}
+
+
+# Coalesces concurrent and repeated fetches of the same URL within a run
+FLIGHTS = SingleFlight()
+
 
 def fetch(url, max_retries=3, backoff=2):
+    # Only the first caller for a URL downloads it, everyone else shares its result
+    return FLIGHTS.do(url, lambda: download(url, max_retries, backoff))
+
+
+def download(url, max_retries=3, backoff=2):
+    cached = HTTP_CACHE.get(url) if HTTP_CACHE_ENABLED else None
     for attempt in range(1, max_retries + 1):
+        retry_after = None
         try:
-            time.sleep(0.25)
+            with METRICS.stage("fetch.delay"):
+                LIMITER.acquire(url)
             logging.info(f"Attempt {attempt} to fetch {url}")
-            resp = requests.get(url, headers=HEADERS, timeout=20)
+            METRICS.count("fetch.requests")
+            with METRICS.stage("fetch"):
+                resp = SESSION.get(url, headers=HttpCache.validators(cached), timeout=20)
+            if resp.status_code == 304 and cached:
+                logging.info(f"NOT MODIFIED {url}")
+                METRICS.count("fetch.notModified")
+                return cached["body"]
+            if resp.status_code in RETRY_STATUSES:
+                METRICS.count("fetch.rateLimited")
+                retry_after = retry_after_seconds(resp.headers.get("Retry-After"))
+                if retry_after is not None:
+                    # Holds back every request to this host, not just this one
+                    LIMITER.retry_after(url, retry_after)
             resp.raise_for_status()
+            METRICS.count("fetch.bytes", len(resp.content))
+            if HTTP_CACHE_ENABLED:
+                HTTP_CACHE.put(url, resp)
             return resp.text
         except Exception as e:
             logging.warning(f"Fetch attempt {attempt} failed for {url}: {e}")
             if attempt == max_retries:
+                METRICS.count("fetch.failures")
                 raise
-            time.sleep(backoff * attempt)
+            METRICS.count("fetch.retries")
+            # With a Retry-After the limiter already waits it out on the next acquire()
+            if retry_after is None:
+                with METRICS.stage("fetch.delay"):
+                    time.sleep(backoff_delay(attempt, backoff))
     raise RuntimeError("unreachable")
 
 
@@ -30,7 +127,9 @@ T = TypeVar("T", bound=BaseModel)
 
 def safe_parse(model: Type[T], data: dict) -> Optional[T]:
     try:
-        return model.model_validate(data)
+        with METRICS.stage("validate"):
+            return model.model_validate(data)
     except ValidationError as e:
+        METRICS.count("validate.failures")
         logging.error(f"Validation failed for {model.__name__}:\n{e}")
         return None